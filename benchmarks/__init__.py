@@ -0,0 +1,7 @@
+"""Бенчмарки генераторов rutau на небольшом корпусе новостей с моделями-заменителями
+
+```
+python -m benchmarks --output results.json
+python -m benchmarks --compare results.json
+```
+"""
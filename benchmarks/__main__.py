@@ -0,0 +1,31 @@
+import argparse
+import json
+import sys
+from .run import compare, load_corpus, run
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog='benchmarks', description='Бенчмарки генераторов rutau')
+    parser.add_argument('--corpus', help='Текстовый файл, текст на строку (по умолчанию - встроенные новости)')
+    parser.add_argument('--repeat', type=int, default=3, help='Сколько раз прогонять корпус')
+    parser.add_argument('--vocab-size', type=int, default=20000, help='Размер словаря заменителя word2vec')
+    parser.add_argument('--output', help='Сохранить результаты в JSON')
+    parser.add_argument('--compare', help='JSON предыдущего прогона для сравнения')
+    args = parser.parse_args()
+
+    report = run(load_corpus(args.corpus), repeat=args.repeat, vocab_size=args.vocab_size)
+    for name, result in report['results'].items():
+        stages = ', '.join(f'{stage}={value:.3f}s' for stage, value in result['stages'].items())
+        print(f'{name:28s} {result["docs_per_s"]:>10.1f} docs/s {result["samples_per_s"]:>10.1f} samples/s '
+              f'{result["peak_rss_mb"]:>8.1f} MB (+{result["rss_growth_mb"]:.1f})  [{stages}]')
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fp:
+            json.dump(report, fp, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as fp:
+            print('\n'.join(compare(report, json.load(fp))))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
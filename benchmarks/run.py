@@ -0,0 +1,147 @@
+"""Замеры скорости генераторов rutau
+"""
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import rutau
+from rutau import instrument
+from . import stubs
+
+data_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# Замеряемые генераторы: процесс замера получает их при fork, без сериализации
+_cases: Dict[str, Tuple[List[str], Callable[[str], List]]] = {}
+
+
+def load_corpus(path: Optional[str] = None) -> List[str]:
+    """Тексты корпуса, по одному на строку
+    """
+    with open(path or os.path.join(data_path, 'news.txt'), encoding='utf-8') as fp:
+        return [line.strip() for line in fp if line.strip()]
+
+
+def peak_rss_mb() -> float:
+    """Пиковый размер резидентной памяти процесса, МБ
+
+    Это пик за всю жизнь процесса, поэтому каждый генератор замеряется в своём процессе (см. `measure_isolated`).
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS - байты
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def measure(name: str, texts: List[str], generate: Callable[[str], List], repeat: int) -> Dict:
+    """Прогоняет генератор по корпусу `repeat` раз
+
+    Returns:
+        Dict: docs/s, samples/s, собственное время стадий (см. `rutau.instrument`), кэши, пиковая память
+    """
+    start_rss = peak_rss_mb()
+    samples = 0
+    with instrument.collect() as stats:
+        for _ in range(repeat):
+            for text in texts:
+                samples += len(generate(text))
+    seconds = stats.seconds
+    docs = len(texts) * repeat
+    stages = {name: round(stage.self_seconds, 6) for name, stage in sorted(stats.stages.items())}
+    stages['other'] = round(seconds - sum(stage.self_seconds for stage in stats.stages.values()), 6)
+    return {
+        'name': name,
+        'docs': docs,
+        'samples': samples,
+        'seconds': round(seconds, 6),
+        'docs_per_s': round(docs / seconds, 3) if seconds else None,
+        'samples_per_s': round(samples / seconds, 3) if seconds else None,
+        'stages': stages,
+        'caches': stats.as_dict()['caches'],
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'rss_growth_mb': round(peak_rss_mb() - start_rss, 1),
+    }
+
+
+def _measure_case(name: str, repeat: int) -> Dict:
+    texts, generate = _cases[name]
+    return measure(name, texts, generate, repeat)
+
+
+def measure_isolated(name: str, texts: List[str], generate: Callable[[str], List], repeat: int) -> Dict:
+    """`measure` в отдельном процессе, порождённом через fork
+
+    Загруженные модели достаются процессу от родителя, а пиковая память считается с нуля:
+    `peak_rss_mb` - память, которую затронул сам генератор (модели и его данные),
+    `rss_growth_mb` - прирост за время замера. Без fork замер идёт в текущем процессе,
+    и пиковая память общая для всех генераторов.
+    """
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return measure(name, texts, generate, repeat)
+    _cases[name] = (texts, generate)
+    try:
+        with multiprocessing.get_context('fork').Pool(1) as pool:
+            return pool.apply(_measure_case, (name, repeat))
+    finally:
+        del _cases[name]
+
+
+def run(texts: List[str], repeat: int = 3, vocab_size: int = 20000) -> Dict:
+    """Замеряет все генераторы и режимы разбиения
+
+    Returns:
+        Dict: Результаты и описание окружения
+    """
+    stubs.install(texts, vocab_size=vocab_size)
+    from rutau import Anaphorate, Coref, Synonimizer, Document
+    anaphorate = Anaphorate(seed=0)
+    coref = Coref()
+    synonimizer = Synonimizer(seed=0)
+    # Прогреваем загрузку моделей, чтобы она не попала в замеры
+    rutau.preload('ner', 'morph', 'natasha', 'w2v')
+    types = ['PER', 'LOC', 'ORG']
+    samples = [sample for text in texts for sample in anaphorate.anaphorate(text, 'steadily', ['PER'])]
+
+    def chain(text: str) -> List:
+        # Все генераторы на одном документе: текст разбирается один раз
+        doc = Document(text)
+        return (anaphorate.anaphorate(doc, 'steadily', types) + anaphorate.find_pronoun_pairs(doc)
+                + coref.get_anaphoras(doc, shift=True) + synonimizer.synonimize_text(doc, ['NOUN', 'ADJF', 'VERB']))
+
+    results = [
+        measure_isolated('anaphorate.steadily', texts,
+                         lambda text: anaphorate.anaphorate(text, 'steadily', types), repeat),
+        measure_isolated('anaphorate.differently', texts,
+                         lambda text: anaphorate.anaphorate(text, 'differently', types), repeat),
+        measure_isolated('pronouns', texts, anaphorate.find_pronoun_pairs, repeat),
+        measure_isolated('coref', texts, lambda text: coref.get_anaphoras(text, shift=True), repeat),
+        measure_isolated('synonymize', texts,
+                         lambda text: synonimizer.synonimize_text(text, ['NOUN', 'ADJF', 'VERB']), repeat),
+        measure_isolated('rename', [json.dumps(sample) for sample in samples],
+                         lambda sample: anaphorate.rename_antecedent([json.loads(sample)], surname=False, count=10),
+                         repeat),
+        measure_isolated('chain', texts, chain, repeat),
+    ]
+    return {
+        'rutau_version': rutau.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'repeat': repeat,
+        'results': {result['name']: result for result in results},
+    }
+
+
+def compare(current: Dict, baseline: Dict) -> List[str]:
+    """Строки сравнения docs/s текущего прогона с сохранённым
+    """
+    lines = []
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None or not base['docs_per_s'] or not result['docs_per_s']:
+            continue
+        ratio = result['docs_per_s'] / base['docs_per_s']
+        lines.append(f'{name:28s} {base["docs_per_s"]:>10.1f} -> {result["docs_per_s"]:>10.1f} docs/s  x{ratio:.2f}')
+    return lines
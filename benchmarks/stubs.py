@@ -0,0 +1,166 @@
+"""Лёгкие заменители моделей для бенчмарков
+
+Бенчмарки должны работать без скачивания моделей, поэтому NER, word2vec и
+теггеры natasha подменяются в реестре `rutau` простыми локальными объектами
+с тем же интерфейсом. pymorphy2 и сегментатор natasha остаются настоящими:
+они ставятся вместе с пакетами и ничего не скачивают.
+"""
+import re
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from types import SimpleNamespace
+from typing import Iterable, Iterator, List
+import numpy as np
+import rutau
+
+Span = namedtuple('Span', ['start', 'stop', 'type'])
+SpanMarkup = namedtuple('SpanMarkup', ['text', 'spans'])
+MorphToken = namedtuple('MorphToken', ['text', 'pos', 'feats'])
+MorphMarkup = namedtuple('MorphMarkup', ['tokens'])
+
+# Основы сущностей из `data/news.txt`
+GAZETTEER = {
+    'PER': ['Анатол', 'Локот', 'Локт', 'Серге', 'Александровск', 'Дарь', 'Касаткин', 'Александр',
+            'Беглов', 'Эльвир', 'Набиуллин', 'Ирин', 'Смирнов', 'Иван', 'Рустам', 'Минниханов',
+            'Людмил', 'Улицк', 'Олег', 'Кононенко'],
+    'LOC': ['Новосибирск', 'Москв', 'Калининград', 'Рим', 'Испани', 'Санкт-Петербург', 'Росси',
+            'Якути', 'Казан', 'Татарстан', 'Арбат', 'Земл', 'Казахстан'],
+    'ORG': ['Аэрофлот', 'Банк', 'Сбербанк', 'Томск', 'Зенит', 'Спартак', 'Эксмо', 'МКС',
+            'Роскосмос', 'Федераци', 'Комитет'],
+}
+CAPITALIZED = re.compile(r'[А-ЯЁ][А-ЯЁа-яё-]*(?:\s+[А-ЯЁ][А-ЯЁа-яё-]*)*')
+WORD = re.compile(r'\S+')
+
+
+def entity_type(word: str):
+    for type, stems in GAZETTEER.items():
+        for stem in stems:
+            if word.startswith(stem):
+                return type
+    return None
+
+
+def find_spans(text: str) -> List[Span]:
+    """Сущности - последовательности слов с заглавной буквы, начиная с первого слова из словаря
+    """
+    spans = []
+    for match in CAPITALIZED.finditer(text):
+        words = list(WORD.finditer(match.group()))
+        for i, word in enumerate(words):
+            type = entity_type(word.group())
+            if type is not None:
+                # Тип сущности - по первому слову, правее захватываем только слова того же типа
+                stop = word.end()
+                for next_word in words[i+1:]:
+                    if entity_type(next_word.group()) not in [type, None]:
+                        break
+                    stop = next_word.end()
+                spans.append(Span(match.start() + word.start(), match.start() + stop, type))
+                break
+    return spans
+
+
+class StubTagger(ABC):
+    """Общая часть интерфейса теггеров slovnet: `map`, `__call__`, `batch_size`, `infer.encoder`
+    """
+    def __init__(self, batch_size: int = 8):
+        self.batch_size = batch_size
+        self.infer = SimpleNamespace(encoder=SimpleNamespace(batch_size=batch_size))
+
+    @abstractmethod
+    def tag(self, item):
+        """Разметка одного текста или предложения"""
+
+    def map(self, items: Iterable) -> Iterator:
+        for item in items:
+            yield self.tag(item)
+
+    def __call__(self, item):
+        return next(self.map([item]))
+
+
+class StubNER(StubTagger):
+    """Заменитель `slovnet.NER` и `natasha.NewsNERTagger`: поиск сущностей по словарю основ
+    """
+    def tag(self, text: str) -> SpanMarkup:
+        return SpanMarkup(text, find_spans(text))
+
+
+UD_POS = {
+    'NOUN': 'NOUN', 'ADJF': 'ADJ', 'ADJS': 'ADJ', 'COMP': 'ADJ', 'VERB': 'VERB', 'INFN': 'VERB',
+    'PRTF': 'VERB', 'PRTS': 'VERB', 'GRND': 'VERB', 'NUMR': 'NUM', 'ADVB': 'ADV', 'NPRO': 'PRON',
+    'PRED': 'ADV', 'PREP': 'ADP', 'CONJ': 'CCONJ', 'PRCL': 'PART', 'INTJ': 'INTJ',
+}
+UD_FEATS = {
+    'masc': ('Gender', 'Masc'), 'femn': ('Gender', 'Fem'), 'neut': ('Gender', 'Neut'),
+    'sing': ('Number', 'Sing'), 'plur': ('Number', 'Plur'),
+    'nomn': ('Case', 'Nom'), 'gent': ('Case', 'Gen'), 'datv': ('Case', 'Dat'),
+    'accs': ('Case', 'Acc'), 'ablt': ('Case', 'Ins'), 'loct': ('Case', 'Loc'),
+}
+
+
+class StubMorphTagger(StubTagger):
+    """Заменитель `natasha.NewsMorphTagger`: признаки UD из первого разбора pymorphy2
+    """
+    def __init__(self, batch_size: int = 8):
+        StubTagger.__init__(self, batch_size)
+        self.morph = rutau.get_model('morph')
+
+    def tag(self, words: List[str]) -> MorphMarkup:
+        tokens = []
+        for word in words:
+            tag = self.morph.parse(word)[0].tag
+            if 'PNCT' in tag:
+                pos = 'PUNCT'
+            elif 'Name' in tag or 'Surn' in tag or 'Geox' in tag:
+                pos = 'PROPN'
+            else:
+                pos = UD_POS.get(tag.POS, 'X')
+            feats = dict(UD_FEATS[grammeme] for grammeme in tag.grammemes if grammeme in UD_FEATS)
+            tokens.append(MorphToken(word, pos, feats))
+        return MorphMarkup(tokens)
+
+
+class StubKeyedVectors:
+    """Заменитель `gensim.models.KeyedVectors` со случайными нормированными векторами
+
+    Словарь - леммы корпуса (`лемма_ЧАСТЬРЕЧИ`), дополненные синтетическими ключами до `size`.
+    """
+    def __init__(self, keys: List[str], size: int = 20000, dim: int = 300, seed: int = 0):
+        keys = list(dict.fromkeys(keys))
+        pos = ['NOUN', 'ADJF', 'VERB']
+        keys += [f'слово{i}_{pos[i % 3]}' for i in range(max(0, size - len(keys)))]
+        self.index2word = keys
+        self.vocab = {key: SimpleNamespace(index=i) for i, key in enumerate(keys)}
+        vectors = np.random.RandomState(seed).standard_normal((len(keys), dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.vectors = self.vectors_norm = vectors
+
+
+def corpus_keys(texts: List[str]) -> List[str]:
+    """Ключи word2vec для всех слов корпуса
+    """
+    from razdel import tokenize
+    morph = rutau.get_model('morph')
+    keys = []
+    for text in texts:
+        for token in tokenize(text):
+            parse = morph.parse(token.text)[0]
+            if parse.tag.POS in ['NOUN', 'ADJF', 'VERB']:
+                keys.append(f'{parse.normal_form}_{parse.tag.POS}')
+    return keys
+
+
+def install(texts: List[str], vocab_size: int = 20000) -> None:
+    """Подменяет модели в реестре `rutau` заменителями
+    """
+    from natasha import Segmenter, MorphVocab
+    rutau.register_model('ner', lambda path: StubNER())
+    rutau.register_model('w2v', lambda path: StubKeyedVectors(corpus_keys(texts), size=vocab_size))
+    rutau.register_model('natasha', lambda path: {
+        'segmenter': Segmenter(),
+        'morph_vocab': MorphVocab(),
+        'emb': None,
+        'morph_tagger': StubMorphTagger(),
+        'ner_tagger': StubNER(),
+    })
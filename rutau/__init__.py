@@ -1,9 +1,21 @@
+import copy
+import functools
+import importlib
 import os
+import pickle
 import shutil
-import wget
-from navec import Navec
-from slovnet import NER
-from gensim.models import KeyedVectors
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Тяжёлые зависимости (slovnet, navec, gensim, pymorphy2, natasha) и сами генераторы
+# импортируются лениво: `import rutau` и `from rutau.splitter import ...` ничего не загружают
+if TYPE_CHECKING:
+    from slovnet import NER
+    from gensim.models import KeyedVectors
+    from .synonimizers import Synonimizer
+    from .anaphorate import Anaphorate
+    from .coref import Coref, CorefItem
+    from .document import Document
 
 __version__ = '0.1.5'
 
@@ -12,7 +24,7 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 models_path = os.environ.get('MODELS_PATH') or os.path.join(basedir, 'models')
 data_path = os.path.join(basedir, 'datafiles')
 
-def load_ner(models_path: str) -> NER:
+def load_ner(models_path: str) -> 'NER':
     """Загружаем и инициализируем NER-модель
 
     Args:
@@ -21,6 +33,9 @@ def load_ner(models_path: str) -> NER:
     Returns:
         slovnet.NER: Объект slovnet.NER
     """
+    import wget
+    from navec import Navec
+    from slovnet import NER
     os.makedirs(models_path, exist_ok=True)
     if not os.path.isfile(os.path.join(models_path, 'navec_news_v1_1B_250K_300d_100q.tar')):
         wget.download('https://storage.yandexcloud.net/natasha-navec/packs/navec_news_v1_1B_250K_300d_100q.tar',
@@ -33,13 +48,19 @@ def load_ner(models_path: str) -> NER:
     ner.navec(navec)
     return ner
 
-def load_w2v(models_path: str) -> KeyedVectors:
-    """Загрузка модели word2vec
+W2V_NAME = 'ruwikiruscorpora_upos_skipgram_300_2_2019'
+
+def download_w2v(models_path: str) -> str:
+    """Скачиваем модель word2vec в исходном бинарном формате
 
     https://rusvectores.org/ru/models/
+
+    Returns:
+        str: Путь к файлу `.w2v`
     """
+    import wget
     os.makedirs(models_path, exist_ok=True)
-    if not os.path.isfile(os.path.join(models_path, 'ruwikiruscorpora_upos_skipgram_300_2_2019.w2v')):
+    if not os.path.isfile(os.path.join(models_path, f'{W2V_NAME}.w2v')):
         wget.download('http://vectors.nlpl.eu/repository/20/182.zip',
                       os.path.join(models_path, '182.zip'))
         shutil.unpack_archive(
@@ -47,17 +68,349 @@ def load_w2v(models_path: str) -> KeyedVectors:
             os.path.join(models_path, 'w2v'), 'zip')
         shutil.copy(
             os.path.join(models_path, 'w2v', 'model.bin'),
-            os.path.join(models_path, 'ruwikiruscorpora_upos_skipgram_300_2_2019.w2v'))
+            os.path.join(models_path, f'{W2V_NAME}.w2v'))
         shutil.rmtree(os.path.join(models_path, 'w2v'))
         os.remove(os.path.join(models_path, '182.zip'))
-    w2v_model = KeyedVectors.load_word2vec_format(
-        os.path.join(models_path, 'ruwikiruscorpora_upos_skipgram_300_2_2019.w2v'),
-        binary=True)
+    return os.path.join(models_path, f'{W2V_NAME}.w2v')
+
+def convert_w2v(models_path: str) -> str:
+    """Однократно конвертируем модель word2vec в нативный формат gensim
+
+    Векторы нормируются заранее и сохраняются отдельным `.npy`-файлом, поэтому
+    `load_w2v` может открыть их через memory-mapping без разбора и нормировки.
+
+    Args:
+        models_path (str): Папка, в которой расположены необходимые для работы модели
+
+    Returns:
+        str: Путь к сконвертированной модели
+    """
+    from gensim.models import KeyedVectors
+    native_path = os.path.join(models_path, f'{W2V_NAME}.kv')
+    w2v_model = KeyedVectors.load_word2vec_format(download_w2v(models_path), binary=True)
     w2v_model.init_sims(replace=True)
+    # Пишем во временный файл и переименовываем: параллельный запуск
+    # не увидит наполовину записанную модель
+    tmp_path = f'{native_path}.{os.getpid()}.tmp'
+    w2v_model.save(tmp_path)
+    if os.path.isfile(f'{tmp_path}.vectors.npy'):
+        os.replace(f'{tmp_path}.vectors.npy', f'{native_path}.vectors.npy')
+    os.replace(tmp_path, native_path)
+    return native_path
+
+def load_w2v(models_path: str) -> 'KeyedVectors':
+    """Загрузка модели word2vec
+
+    При первом запуске модель конвертируется в нативный формат (см. `convert_w2v`),
+    дальше нормированные векторы открываются только для чтения через memory-mapping,
+    и страницы с ними разделяются между процессами.
+
+    https://rusvectores.org/ru/models/
+    """
+    from gensim.models import KeyedVectors
+    native_path = os.path.join(models_path, f'{W2V_NAME}.kv')
+    if not os.path.isfile(native_path):
+        convert_w2v(models_path)
+    w2v_model = KeyedVectors.load(native_path, mmap='r')
+    # Векторы уже нормированы при конвертации
+    w2v_model.vectors_norm = w2v_model.vectors
     return w2v_model
 
+def build_neighbours(models_path: str, topn: int = 10, max_rank: Optional[int] = None,
+                     pos: Optional[List[str]] = None) -> str:
+    """Однократно считаем таблицу ближайших соседей для словаря word2vec
+
+    Args:
+        models_path (str): Папка, в которой расположены необходимые для работы модели
+
+        topn (int): Сколько соседей хранить для каждого ключа.
+
+        max_rank (Optional[int]): Брать только столько самых частотных слов словаря.
+
+        pos (Optional[List[str]]): Брать только ключи с этими частями речи.
+
+    Returns:
+        str: Путь к папке с таблицей
+    """
+    from .neighbours import build_neighbour_table
+    path = os.path.join(models_path, f'{W2V_NAME}.neighbours')
+    table = build_neighbour_table(get_model('w2v', models_path), topn=topn, max_rank=max_rank, pos=pos)
+    table.save(path)
+    return path
+
+def load_neighbours(models_path: str):
+    """Загрузка таблицы ближайших соседей word2vec (см. `build_neighbours`)
+
+    Матрицы соседей открываются через memory-mapping, векторы word2vec не загружаются.
+    """
+    from .neighbours import NeighbourTable
+    return NeighbourTable.load(os.path.join(models_path, f'{W2V_NAME}.neighbours'))
+
+def build_compact_w2v(models_path: str, dtype: str = 'float16', max_rank: Optional[int] = None,
+                      pos: Optional[List[str]] = None) -> str:
+    """Однократно сжимаем модель word2vec до float16 или int8 (см. `rutau.compact`)
+
+    Заодно проверяется, насколько соседи по сжатой матрице совпадают с соседями
+    по float32; результат записывается в `meta.json` (`recall`).
+
+    Args:
+        models_path (str): Папка, в которой расположены необходимые для работы модели
+
+        dtype (str): `float16` или `int8`.
+
+        max_rank (Optional[int]): Оставить только столько самых частотных слов словаря.
+
+        pos (Optional[List[str]]): Оставить только ключи с этими частями речи.
+
+    Returns:
+        str: Путь к папке со сжатой моделью
+    """
+    from .compact import CompactKeyedVectors, neighbour_recall
+    path = os.path.join(models_path, f'{W2V_NAME}.{dtype}')
+    w2v_model = load_w2v(models_path)
+    compact = CompactKeyedVectors.from_keyed_vectors(w2v_model, dtype=dtype, max_rank=max_rank, pos=pos)
+    compact.meta['recall'] = neighbour_recall(w2v_model, compact)
+    compact.save(path)
+    return path
+
+def load_compact_w2v(models_path: str, dtype: str = 'float16'):
+    """Загрузка сжатой модели word2vec (см. `build_compact_w2v`)
+
+    Если сжатой модели ещё нет, она строится по полному словарю.
+    Матрица открывается через memory-mapping.
+    """
+    from .compact import CompactKeyedVectors
+    path = os.path.join(models_path, f'{W2V_NAME}.{dtype}')
+    if not os.path.isfile(os.path.join(path, 'vectors.npy')):
+        build_compact_w2v(models_path, dtype)
+    return CompactKeyedVectors.load(path)
+
+def load_nomen(path: str) -> Dict[str, List[str]]:
+    """Загрузка словаря имён или фамилий, сгруппированных по роду
+
+    Args:
+        path (str): Путь к pickle-файлу со словарём `имя -> род` (`m`, `f`).
+
+    Returns:
+        Dict[str, List[str]]: Род -> список имён
+    """
+    with open(path, 'rb') as fp:
+        nomen = pickle.load(fp)
+    pools: Dict[str, List[str]] = {}
+    for name, gender in nomen.items():
+        pools.setdefault(gender, []).append(name)
+    return pools
+
+def load_morph(models_path: str):
+    """Инициализация морфологического анализатора pymorphy2 с LRU-кэшем (см. `rutau.morph`)
+
+    Словари pymorphy2 поставляются отдельным пакетом, поэтому `models_path` не используется
+    и нужен лишь для единообразия с остальными загрузчиками.
+    """
+    import pymorphy2
+    from .morph import CachedMorphAnalyzer
+    return CachedMorphAnalyzer(pymorphy2.MorphAnalyzer())
+
+def load_natasha(models_path: str) -> Dict[str, Any]:
+    """Инициализация моделей natasha, которые использует `Coref`
+
+    Модели natasha поставляются вместе с пакетом, `models_path` не используется.
+
+    Returns:
+        Dict[str, Any]: Сегментатор, словарь лемматизации, эмбеддинги, морфологический и NER-теггеры
+    """
+    from natasha import Segmenter, MorphVocab, NewsEmbedding, NewsMorphTagger, NewsNERTagger
+    emb = NewsEmbedding()
+    return {
+        'segmenter': Segmenter(),
+        'morph_vocab': MorphVocab(),
+        'emb': emb,
+        'morph_tagger': NewsMorphTagger(emb),
+        'ner_tagger': NewsNERTagger(emb),
+    }
+
+def with_batch_size(tagger, batch_size: int):
+    """Возвращает копию теггера slovnet/natasha с другим размером батча
+
+    Веса модели не копируются, поэтому копия дешёвая, а общий экземпляр
+    из реестра не меняется.
+
+    Args:
+        tagger: Теггер slovnet (`NER`, `Morph`) или natasha (`NewsNERTagger`, `NewsMorphTagger`).
+
+        batch_size (int): Размер батча при инференсе.
+    """
+    tagger = copy.copy(tagger)
+    tagger.infer = copy.copy(tagger.infer)
+    tagger.infer.encoder = copy.copy(tagger.infer.encoder)
+    tagger.batch_size = batch_size
+    tagger.infer.encoder.batch_size = batch_size
+    return tagger
+
+def chunked(items: Iterable, size: int) -> Iterator[List]:
+    """Разбивает поток на списки по `size` элементов
+    """
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+### Реестр моделей
+#
+# Модели тяжёлые, поэтому на процесс держим по одному экземпляру каждой модели
+# для каждого пути. Загрузка ленивая: модель поднимается при первом обращении.
+
+_loaders: Dict[str, Callable[[str], Any]] = {
+    'ner': load_ner,
+    'w2v': load_w2v,
+    'w2v_float16': lambda path: load_compact_w2v(path, 'float16'),
+    'w2v_int8': lambda path: load_compact_w2v(path, 'int8'),
+    'neighbours': load_neighbours,
+    'morph': load_morph,
+    'natasha': load_natasha,
+}
+# Основные модели: `preload()` без аргументов загружает только их. Сжатые векторы и таблица
+# соседей строятся отдельно и могут отсутствовать, поэтому загружаются только по имени
+CORE_MODELS = ['ner', 'w2v', 'morph', 'natasha']
+# Пакеты и файлы, от которых зависит результат модели (см. `model_version`)
+_model_packages: Dict[str, List[str]] = {
+    'ner': ['slovnet', 'navec'],
+    # pymorphy2 0.8 (requirements.txt) берёт словари из pymorphy2-dicts, более новые - из pymorphy2-dicts-ru
+    'morph': ['pymorphy2', 'pymorphy2-dicts', 'pymorphy2-dicts-ru'],
+    'natasha': ['natasha', 'slovnet'],
+}
+_model_files: Dict[str, List[str]] = {
+    'ner': ['navec_news_v1_1B_250K_300d_100q.tar', 'slovnet_ner_news_v1.tar'],
+    'w2v': [f'{W2V_NAME}.kv'],
+}
+_models: Dict[Tuple[str, str], Any] = {}
+_model_locks: Dict[Tuple[str, str], threading.Lock] = {}
+_registry_lock = threading.Lock()
+
+def register_model(name: str, loader: Callable[[str], Any]) -> None:
+    """Регистрирует (или подменяет) загрузчик модели
+
+    Уже загруженные экземпляры модели с этим именем выгружаются.
+
+    Args:
+        name (str): Имя модели в реестре.
+
+        loader (Callable[[str], Any]): Функция, принимающая путь и возвращающая модель.
+    """
+    with _registry_lock:
+        _loaders[name] = loader
+        for key in [key for key in _models if key[0] == name]:
+            del _models[key]
+
+def get_model(name: str, path: Optional[str] = None) -> Any:
+    """Возвращает общий для процесса экземпляр модели, при необходимости загружая его
+
+    Args:
+        name (str): Имя модели: `ner`, `w2v`, `w2v_float16`, `w2v_int8`, `neighbours`, `morph`, `natasha`.
+
+        path (Optional[str]): Папка с моделями. По умолчанию - `models_path`.
+
+    Returns:
+        Any: Загруженная модель
+    """
+    key = (name, path or models_path)
+    model = _models.get(key)
+    if model is not None:
+        return model
+    with _registry_lock:
+        if name not in _loaders:
+            raise KeyError(f'Unknown model: {name}')
+        lock = _model_locks.setdefault(key, threading.Lock())
+    with lock:
+        model = _models.get(key)
+        if model is None:
+            model = _loaders[name](key[1])
+            _models[key] = model
+    return model
+
+@functools.lru_cache(maxsize=None)
+def _package_version(package: str) -> str:
+    import importlib.metadata
+    try:
+        return importlib.metadata.version(package)
+    except importlib.metadata.PackageNotFoundError:
+        return 'none'
+
+def model_version(name: str, path: Optional[str] = None) -> str:
+    """Идентификатор модели, не загружая её: загрузчик, версии пакетов и файлы моделей (имя и размер)
+
+    Меняется при подмене загрузчика (`register_model`), обновлении пакетов и замене файлов
+    моделей, поэтому подходит для ключей кэшей разметки (см. `rutau.annotation_cache`).
+
+    Args:
+        name (str): Имя модели в реестре.
+
+        path (Optional[str]): Папка с моделями. По умолчанию - `models_path`.
+
+    Returns:
+        str: Идентификатор модели
+    """
+    with _registry_lock:
+        if name not in _loaders:
+            raise KeyError(f'Unknown model: {name}')
+        loader = _loaders[name]
+    parts = [name, f'{loader.__module__}.{getattr(loader, "__qualname__", type(loader).__name__)}']
+    parts += [f'{package}=={_package_version(package)}' for package in _model_packages.get(name, [])]
+    for filename in _model_files.get(name, []):
+        file = os.path.join(path or models_path, filename)
+        parts.append(f'{filename}:{os.path.getsize(file) if os.path.isfile(file) else "none"}')
+    return ';'.join(parts)
+
+def preload(*names: str, path: Optional[str] = None) -> None:
+    """Заранее загружает модели (например, в родительском процессе перед fork)
+
+    Args:
+        names (str): Имена моделей. Если не указаны - загружаются основные (`CORE_MODELS`):
+        `ner`, `w2v`, `morph`, `natasha`.
+
+        path (Optional[str]): Папка с моделями. По умолчанию - `models_path`.
+    """
+    for name in names or CORE_MODELS:
+        get_model(name, path)
+
+def release(*names: str, path: Optional[str] = None) -> None:
+    """Выгружает модели из реестра
+
+    Объекты, которые уже держат ссылку на модель, продолжают ею пользоваться.
+
+    Args:
+        names (str): Имена моделей. Если не указаны - выгружаются все.
+
+        path (Optional[str]): Папка с моделями. Если не указана - выгружаются экземпляры для всех путей.
+    """
+    with _registry_lock:
+        for key in list(_models):
+            if (not names or key[0] in names) and (path is None or key[1] == path):
+                del _models[key]
+
 
 ###
-from .synonimizers import Synonimizer
-from .anaphorate import Anaphorate
-from .coref import Coref, CorefItem
\ No newline at end of file
+_lazy_attributes = {
+    'Synonimizer': 'synonimizers',
+    'Anaphorate': 'anaphorate',
+    'Coref': 'coref',
+    'CorefItem': 'coref',
+    'Document': 'document',
+}
+
+def __getattr__(name: str) -> Any:
+    """Генераторы импортируются при первом обращении (`rutau.Anaphorate`, `from rutau import Coref`)
+    """
+    if name not in _lazy_attributes:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(f'.{_lazy_attributes[name]}', __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__() -> List[str]:
+    return sorted(list(globals()) + list(_lazy_attributes))
\ No newline at end of file
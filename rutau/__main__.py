@@ -0,0 +1,148 @@
+"""Командная строка: `python -m rutau <генератор> <вход> <выход> [параметры]`
+
+Пример:
+
+```
+python -m rutau anaphorate news.txt corpus.jsonl.gz --splitting steadily --types PER ORG --workers 16
+```
+"""
+import argparse
+import os
+import sys
+from typing import Dict, List, Optional
+from .corpus import JsonlWriter, read_corpus, iter_samples, run_sharded
+
+
+def generator_kwargs(args: argparse.Namespace) -> Dict:
+    """Параметры генератора из аргументов командной строки
+    """
+    if args.method == 'anaphorate':
+        return {'sent_splitting': args.splitting, 'anaph_type': args.types, 'max_distance': args.max_distance}
+    if args.method == 'coref':
+        return {'shift': args.shift}
+    if args.method == 'synonymize':
+        return {'type': args.pos}
+    if args.method == 'rename':
+        return {'surname': args.surname, 'count': args.count}
+    return {}
+
+
+def generator_options(args: argparse.Namespace) -> Dict:
+    """Параметры конструктора генератора из аргументов командной строки
+    """
+    if args.method in ['synonymize', 'serve']:
+        return {'use_neighbours': args.neighbours, 'vectors': args.vectors}
+    return {}
+
+
+def add_synonymizer_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--neighbours', action='store_true',
+                        help='Синонимы из заранее посчитанной таблицы соседей (rutau.neighbours), без векторов word2vec')
+    parser.add_argument('--vectors', choices=['float32', 'float16', 'int8'], default='float32',
+                        help='Точность векторов word2vec (rutau.compact)')
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='rutau', description='Генерация синтетических размеченных корпусов')
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('input', help='Входной корпус: текстовый файл (текст на строку), JSONL или папка; `-` - stdin')
+    common.add_argument('output', help='Выходной JSONL; `.gz` - со сжатием; `-` - stdout. '
+                                       'С --shard-size - папка для шардов')
+    common.add_argument('--format', choices=['lines', 'jsonl', 'dir'], help='Формат входного корпуса')
+    common.add_argument('--gzip', action='store_true', help='Сжимать выходной файл gzip')
+    common.add_argument('--workers', type=int, default=0, help='Количество процессов (0 - без пула)')
+    common.add_argument('--batch-size', type=int, default=32, help='Размер пачки текстов')
+    common.add_argument('--shard-size', type=int, help='Писать шардами по столько входных текстов '
+                                                       'с манифестом; повторный запуск продолжает с места остановки')
+    common.add_argument('--cache', help='Файл SQLite для кэша NER и морфологии (anaphorate, coref); '
+                                        'повторные запуски на тех же текстах не запускают модели')
+    common.add_argument('--cache-max-mb', type=int, help='Предельный размер кэша разметки, МБ')
+    common.add_argument('--dedup', action='store_true', help='Отбрасывать точные повторы сэмплов (текст и разметка)')
+    common.add_argument('--near-dup', action='store_true', help='Отбрасывать и почти повторы текстов (MinHash LSH)')
+    common.add_argument('--near-dup-items', type=int, default=100000,
+                        help='Сколько сэмплов помнить для почти повторов; до 1 КБ памяти на сэмпл')
+
+    methods = parser.add_subparsers(dest='method', required=True)
+    anaphorate = methods.add_parser('anaphorate', parents=[common], help='Anaphorate.anaphorate')
+    anaphorate.add_argument('--splitting', choices=['steadily', 'differently'], default='steadily')
+    anaphorate.add_argument('--types', nargs='+', choices=['PER', 'LOC', 'ORG'], default=['PER'])
+    anaphorate.add_argument('--max-distance', type=int, help='Для differently - максимальное расстояние между предложениями пары')
+    methods.add_parser('pronouns', parents=[common], help='Anaphorate.find_pronoun_pairs')
+    coref = methods.add_parser('coref', parents=[common], help='Coref.get_anaphoras')
+    coref.add_argument('--no-shift', dest='shift', action='store_false')
+    synonymize = methods.add_parser('synonymize', parents=[common], help='Synonimizer.synonimize_text')
+    synonymize.add_argument('--pos', nargs='+', choices=['NOUN', 'ADJF', 'VERB'], default=['NOUN', 'ADJF', 'VERB'])
+    add_synonymizer_arguments(synonymize)
+    rename = methods.add_parser('rename', parents=[common], help='Anaphorate.rename_antecedent (вход - JSONL-сэмплы)')
+    rename.add_argument('--surname', action='store_true',
+                        help='Добавлять фамилии; нужен словарь rutau/datafiles/surnames.pickle, он не поставляется')
+    rename.add_argument('--count', type=int, default=5)
+
+    serve = methods.add_parser('serve', help='Локальный HTTP-сервис с микробатчингом (см. rutau.server)')
+    serve.add_argument('--host', default='127.0.0.1', help='Только локальный адрес: 127.0.0.1, ::1, localhost')
+    serve.add_argument('--port', type=int, default=8765)
+    serve.add_argument('--methods', nargs='+', choices=['anaphorate', 'coref', 'synonymize'],
+                       help='Какие генераторы обслуживать (по умолчанию - все)')
+    serve.add_argument('--max-batch-size', type=int, default=32, help='Максимум текстов в пачке')
+    serve.add_argument('--max-latency-ms', type=float, default=10, help='Сколько ждать добора пачки, мс')
+    serve.add_argument('--threads', type=int, default=1, help='Количество потоков для моделей')
+    serve.add_argument('--cache', help='Файл SQLite для кэша NER и морфологии')
+    serve.add_argument('--cache-max-mb', type=int, help='Предельный размер кэша разметки, МБ')
+    add_synonymizer_arguments(serve)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.cache:
+        # Через окружение кэш доходит и до рабочих процессов (см. `rutau.annotation_cache.from_environ`)
+        os.environ['ANNOTATION_CACHE_PATH'] = args.cache
+        if args.cache_max_mb:
+            os.environ['ANNOTATION_CACHE_MAX_BYTES'] = str(args.cache_max_mb * 1024 * 1024)
+    if args.method == 'serve':
+        from .server import is_loopback, serve
+        if not is_loopback(args.host):
+            print(f'--host {args.host} is not a loopback address: the service has no authentication', file=sys.stderr)
+            return 2
+        serve(args.host, args.port, methods=args.methods, max_batch_size=args.max_batch_size,
+              max_latency=args.max_latency_ms / 1000, threads=args.threads,
+              options={'synonymize': generator_options(args)},
+              ready=lambda: print(f'Serving on http://{args.host}:{args.port}', file=sys.stderr))
+        return 0
+    if args.method == 'rename' and args.surname:
+        from .synonimizers import nomen_path
+        if not os.path.isfile(nomen_path('surname')):
+            print(f'--surname needs {nomen_path("surname")}: the surname list is not shipped with rutau', file=sys.stderr)
+            return 2
+    format = args.format
+    if format is None and args.method == 'rename':
+        # Для переименования на входе всегда размеченные сэмплы
+        format = 'jsonl'
+    records = read_corpus(args.input, format)
+    dedup = None
+    if args.dedup or args.near_dup:
+        from .dedup import Deduplicator
+        dedup = Deduplicator(near_dup=args.near_dup, near_dup_items=args.near_dup_items)
+    if args.shard_size:
+        manifest = run_sharded(records, args.output, args.method, shard_size=args.shard_size,
+                               compress=args.gzip, dedup=dedup, workers=args.workers,
+                               batch_size=args.batch_size, options=generator_options(args), **generator_kwargs(args))
+        count = sum(shard['samples'] for shard in manifest['shards'].values())
+        print(f'{count} samples in {len(manifest["shards"])} shards', file=sys.stderr)
+    else:
+        samples = iter_samples(records, args.method, workers=args.workers, batch_size=args.batch_size,
+                               options=generator_options(args), **generator_kwargs(args))
+        if dedup is not None:
+            samples = dedup.filter(samples)
+        with JsonlWriter(args.output, compress=args.gzip) as writer:
+            count = writer.write_many(samples)
+        print(f'{count} samples written', file=sys.stderr)
+    if dedup is not None:
+        stats = dedup.stats()
+        print(f'{stats["exact_duplicates"]} exact and {stats["near_duplicates"]} near duplicates dropped',
+              file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
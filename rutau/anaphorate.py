@@ -1,18 +1,39 @@
-from typing import List, Dict
-import pymorphy2
+from typing import TYPE_CHECKING, List, Dict, Tuple, Iterable, Iterator, Optional, Union
 from razdel import tokenize
-from . import models_path, load_ner
-from .splitter import get_stead_sent_pairs, get_diff_sent_pairs
+from . import get_model, with_batch_size, chunked
+from .document import Document, as_document
+from .instrument import stage
+from .pronouns import inflect_pronoun
+from .splitter import iter_sent_pairs
+from .template import TextTemplate
 from .synonimizers import Synonimizer
 
+if TYPE_CHECKING:
+    from .annotation_cache import AnnotationCache
+
 class Anaphorate:
     """Набор методов для формирования синтетического размеченного корпуса текстов
     для разрешения местоимённой анафоры для русского языка.
     """
-    def __init__(self):
-        self.ner = load_ner(models_path)
-        self.morph = pymorphy2.MorphAnalyzer()
-        self.Synonimizer = Synonimizer()
+    def __init__(self, seed: Optional[int] = None, cache: Optional['AnnotationCache'] = None):
+        """
+        Args:
+            seed (Optional[int]): Зерно генератора случайных чисел (для выбора новых имён).
+
+            cache (Optional[AnnotationCache]): Постоянный кэш NER-разметки предложений
+            (см. `rutau.annotation_cache`).
+        """
+        self.cache = cache
+        self.morph = get_model('morph')
+        self.Synonimizer = Synonimizer(seed=seed)
+
+    @property
+    def ner(self):
+        """NER-модель из общего реестра, загружается при первом обращении
+
+        `find_pronoun_pairs` и `rename_antecedent` NER не используют и модель не загружают.
+        """
+        return get_model('ner')
     
     
     def get_pronoun(self, word: str) -> str:
@@ -24,16 +45,10 @@ class Anaphorate:
         Returns:
             str: местоимение
         """
-        tag = self.morph.parse(word)[0].tag
-        pronoun = self.morph.parse('она')[0] if tag.gender == 'femn' else self.morph.parse('он')[0]
-        tagset = set()
-        if tag.case is not None:
-            tagset.add(tag.case)
-        # if tag.number is not None:
-        #     tagset.add(tag.number)
-        if 'Af-p' in tag:
-            tagset.add('Af-p')
-        return pronoun.inflect(tagset).word
+        with stage('pronoun'):
+            tag = self.morph.parse(word)[0].tag
+            gender = 'femn' if tag.gender == 'femn' else 'masc'
+            return inflect_pronoun(gender, 'sing', tag.case, 'Af-p' in tag)
     
     def anaphorate_sentence(self, sentence: str, ner_type: str) -> List[Dict]:
         """Получем новые тексты путём замены выявленных NER-сущностей местоимениями
@@ -74,24 +89,79 @@ class Anaphorate:
         'text': 'Он купил ботинки. Василий Иванович продал ботинки.'}]
         ```
     
+        """
+        return self.anaphorate_spans(sentence, self.ner_spans(sentence), [ner_type])
+
+    def ner_spans(self, sentence: str) -> List[Tuple[int, int, str]]:
+        """Выделяем NER-сущности в предложении
+
+        Args:
+            sentence (str): Входной текст
+
+        Returns:
+            List[Tuple[int, int, str]]: Список сущностей: начало, конец, тип
+        """
+        return self.sents_spans([sentence])[0]
+
+    def sents_spans(self, sents: List[str], ner=None) -> List[List[Tuple[int, int, str]]]:
+        """Выделяем NER-сущности в предложениях
+
+        Разметка берётся из кэша, если он задан; модель запускается только для
+        остальных предложений, и её результаты сохраняются в кэш.
+
+        Args:
+            sents (List[str]): Предложения
+
+            ner: NER-модель. По умолчанию - модель экземпляра.
+
+        Returns:
+            List[List[Tuple[int, int, str]]]: Сущности каждого предложения: начало, конец, тип
+        """
+        spans = {}
+        if self.cache is not None:
+            spans = {sent: [tuple(span) for span in value]
+                     for sent, value in self.cache.get_many('anaphorate.ner', sents).items()}
+        missing = [sent for sent in dict.fromkeys(sents) if sent not in spans]
+        if missing:
+            with stage('ner', len(missing)):
+                for sent, markup in zip(missing, (ner or self.ner).map(missing)):
+                    spans[sent] = [(span.start, span.stop, span.type) for span in markup.spans]
+            if self.cache is not None:
+                self.cache.put_many('anaphorate.ner', {sent: spans[sent] for sent in missing})
+        return [spans[sent] for sent in sents]
+
+    def anaphorate_spans(self, sentence: str, spans: List[Tuple[int, int, str]], ner_types: List[str]) -> List[Dict]:
+        """То же, что `anaphorate_sentence`, но по уже выделенным NER-сущностям
+
+        Args:
+            sentence (str): Входной текст
+
+            spans (List[Tuple[int, int, str]]): Сущности текста: начало, конец, тип
+
+            ner_types (List[str]): Типы сущностей, по которым формировать сэмплы, в нужном порядке
+
+        Returns:
+            List: Результирующий список, состоящий из антецедента, анафора и нового текста
         """
         new_texts: List = []
-        per_items: List = []
-        ner_tokens = self.ner(sentence).spans
-        for span in ner_tokens:
-            if span.type == ner_type:
-                per_items.append(span)
+        for ner_type in ner_types:
+            new_texts += self._anaphorate_type(sentence, [span for span in spans if span[2] == ner_type])
+        return new_texts
+
+    def _anaphorate_type(self, sentence: str, per_items: List[Tuple[int, int, str]]) -> List[Dict]:
+        new_texts: List = []
         if len(per_items) >= 2:
             # выбираем всех кандидатов
             candidates = []
-            for item in per_items:
-                candidates.append({
-                    'text': sentence[item.start:item.stop],
-                    'lemma': self.morph.parse(sentence[item.start:item.stop])[0].normal_form,
-                    'type': item.type,
-                    'start': item.start,
-                    'stop': item.stop,
-                })
+            with stage('morph', len(per_items)):
+                for start, stop, type in per_items:
+                    candidates.append({
+                        'text': sentence[start:stop],
+                        'lemma': self.morph.parse(sentence[start:stop])[0].normal_form,
+                        'type': type,
+                        'start': start,
+                        'stop': stop,
+                    })
             # оставляем только нужные пары
             candidates_selected = []
             for itemA in candidates:
@@ -146,11 +216,12 @@ class Anaphorate:
                 })
         return new_texts
     
-    def anaphorate(self, text: str, sent_splitting: str, anaph_type: List[str]) -> List[Dict]:
+    def anaphorate(self, text: Union[str, Document], sent_splitting: str, anaph_type: List[str],
+                   max_distance: Optional[int] = None) -> List[Dict]:
         """Метод создаёт из текста корпус текстов для разрешения анафоры.
     
         Args:
-            text (str): Входной текст
+            text (Union[str, Document]): Входной текст или размеченный документ (см. `rutau.document`)
     
             sent_splitting (str): Метод создания пар предложений:
                 * `steadily` - пары последовательных предложений (первое и второе)
@@ -160,30 +231,89 @@ class Anaphorate:
                 * `PER` - имена людей
                 * `LOC` - названия локаций
                 * `ORG` - наименования организаций
+
+            max_distance (Optional[int]): Для `differently` - максимальное расстояние
+            между предложениями пары. По умолчанию - без ограничения.
     
+        Returns:
+            List: Результирующий список, состоящий из антецедента, анафора и нового текста
+        """
+        doc = as_document(text)
+        sents = doc.sent_texts
+        # Каждое предложение размечаем NER-моделью один раз,
+        # а сущности пары получаем сдвигом уже найденных
+        sent_spans = doc.layer('ner', lambda: self.sents_spans(sents))
+        return self.anaphorate_sents(sents, sent_spans, sent_splitting, anaph_type, max_distance)
+
+    def anaphorate_many(self, texts: Iterable[Union[str, Document]], sent_splitting: str, anaph_type: List[str],
+                        batch_size: int = 32, max_distance: Optional[int] = None) -> Iterator[List[Dict]]:
+        """То же, что `anaphorate`, но для потока текстов.
+
+        Предложения из `batch_size` текстов размечаются NER-моделью батчами,
+        результаты отдаются в порядке входных текстов.
+
+        Args:
+            texts (Iterable[Union[str, Document]]): Входные тексты или размеченные документы
+
+            sent_splitting (str): Метод создания пар предложений: `steadily`, `differently`
+
+            anaph_type (list): Из каких сущностей создавать корпус: `PER`, `LOC`, `ORG`
+
+            batch_size (int): Сколько текстов читать за раз и размер батча NER-модели
+
+            max_distance (Optional[int]): Для `differently` - максимальное расстояние между предложениями пары
+
+        Yields:
+            List: Корпус для каждого входного текста
+        """
+        ner = with_batch_size(self.ner, batch_size)
+        for chunk in chunked(texts, batch_size):
+            docs = [as_document(text) for text in chunk]
+            # Документы, у которых NER-слой уже есть, повторно не размечаем
+            missing = [doc for doc in docs if 'ner' not in doc]
+            chunk_spans = iter(self.sents_spans([sent for doc in missing for sent in doc.sent_texts], ner))
+            for doc in missing:
+                doc.layers['ner'] = [next(chunk_spans) for _ in doc.sents]
+            for doc in docs:
+                yield self.anaphorate_sents(doc.sent_texts, doc.ner, sent_splitting, anaph_type, max_distance)
+
+    def anaphorate_sents(self, sents: List[str], sent_spans: List[List[Tuple[int, int, str]]],
+                         sent_splitting: str, anaph_type: List[str],
+                         max_distance: Optional[int] = None) -> List[Dict]:
+        """Формирует корпус из уже размеченных предложений текста
+
+        Args:
+            sents (List[str]): Предложения текста
+
+            sent_spans (List[List[Tuple[int, int, str]]]): NER-сущности каждого предложения
+
+            sent_splitting (str): Метод создания пар предложений: `steadily`, `differently`
+
+            anaph_type (list): Из каких сущностей создавать корпус: `PER`, `LOC`, `ORG`
+
+            max_distance (Optional[int]): Для `differently` - максимальное расстояние между предложениями пары
+
         Returns:
             List: Результирующий список, состоящий из антецедента, анафора и нового текста
         """
         corpus: List = []
+        ner_types = [ner_type for ner_type in ['LOC', 'ORG', 'PER'] if ner_type in anaph_type]
         if sent_splitting == 'steadily':
-            sentences = get_stead_sent_pairs(text)
-        if sent_splitting == 'differently':
-            sentences = get_diff_sent_pairs(text)
-        
-        for sentence in sentences:
-            if 'LOC' in anaph_type:
-                corpus += self.anaphorate_sentence(sentence, ner_type='LOC')
-            if 'ORG' in anaph_type:
-                corpus += self.anaphorate_sentence(sentence, ner_type='ORG')
-            if 'PER' in anaph_type:
-                corpus += self.anaphorate_sentence(sentence, ner_type='PER')
+            max_distance = 1
+        elif sent_splitting != 'differently':
+            raise ValueError(f'Unknown sent_splitting: {sent_splitting}')
+
+        with stage('assemble', len(sents)):
+            for i, j, sentence, offset in iter_sent_pairs(sents, max_distance):
+                spans = sent_spans[i] + [(start + offset, stop + offset, type) for start, stop, type in sent_spans[j]]
+                corpus += self.anaphorate_spans(sentence, spans, ner_types)
         return corpus
     
-    def find_pronoun_pairs(self, sentence) -> List[Dict]:
+    def find_pronoun_pairs(self, sentence: Union[str, Document]) -> List[Dict]:
         """Метод находит в тексте 2 местоимения и связывает их вместе.
     
         Args:
-            sentence (str): Предложение, которе следует преобразовать.
+            sentence (Union[str, Document]): Предложение, которе следует преобразовать (или размеченный документ).
     
         Returns:
             List: Размеченный список (если предложение подходит под условия).
@@ -201,6 +331,8 @@ class Anaphorate:
         ```
     
         """
+        doc = as_document(sentence)
+        sentence = doc.text
         if len(sentence) < 3:
             return []
         
@@ -211,7 +343,7 @@ class Anaphorate:
             ['вы', 'ваши'], ['вы', 'ваше'], ['он', 'его'], ['она', 'её'], ['она', 'ее'],
             ['они', 'их'], ['они', 'ихний'], ['они', 'ихняя'], ['они', 'ихние'],
             ['они', 'ихнее'], ['оно', 'его'],]
-        tokens = list(tokenize(sentence))
+        tokens = doc.tokens
     
         found, antecedent_found, anaphor_found = False, False, False
         for pos, pair in enumerate(pronoun_pairs):
@@ -267,9 +399,9 @@ class Anaphorate:
         
         new_texts: List = []
         for sample in samples:
-            tokens = list(tokenize(sample['text']))
             # define gender
-            gender = self.morph.parse(sample['antecedent']['text'])[0].tag.gender
+            with stage('morph'):
+                gender = self.morph.parse(sample['antecedent']['text'])[0].tag.gender
             if gender == 'masc':
                 gender = 'm'
             elif gender == 'neut':
@@ -278,6 +410,9 @@ class Anaphorate:
                 gender = 'f'
             else:
                 pointer = ''
+                # Текст сэмпла токенизируем, только если род антецедента не определился
+                with stage('tokenize'):
+                    tokens = list(tokenize(sample['text']))
                 for token in tokens:
                     if token.start == sample['antecedent']['end']+1:
                         pointer = token.text
@@ -286,37 +421,33 @@ class Anaphorate:
             # get a list of names
             new_antecedents = self.Synonimizer.get_nomen(count=count, gender=gender, type='name')
             if surname == True:
-                new_antecedents = [item + ' ' + self.Synonimizer.get_nomen(
-                    count=1,
-                    gender=gender,
-                    type='surname')[0] for item in new_antecedents]
-            # replace antecedents with new names
-            for item in new_antecedents:
-                offset = len(sample['antecedent']['text']) - len(item)
-                if sample['anaphor']['start'] > sample['antecedent']['start']:
-                    #needs offset
-                    new_anaphor_start = sample['anaphor']['start'] - offset
-                    new_anaphor_end =  sample['anaphor']['end'] - offset
-                else:
-                    new_anaphor_start = sample['anaphor']['start']
-                    new_anaphor_end =  sample['anaphor']['end']
-                new_antecedent_text = item
-                new_text = sample['text'][:sample['antecedent']['start']] \
-                + item + sample['text'][sample['antecedent']['end']:]
-                new_antecedent_end = sample['antecedent']['end'] - offset
-                new_antecedent_start = sample['antecedent']['start']
-    
-                new_texts.append({
-                    'text': new_text,
-                    'antecedent': {
-                        'text': new_antecedent_text,
-                        'start': new_antecedent_start,
-                        'end': new_antecedent_end,
-                    },
-                    'anaphor': {
-                        'text': sample['anaphor']['text'],
-                        'start': new_anaphor_start,
-                        'end': new_anaphor_end,
-                    },
-                })
+                surnames = self.Synonimizer.get_nomen(count=count, gender=gender, type='surname')
+                new_antecedents = [name + ' ' + last_name for name, last_name in zip(new_antecedents, surnames)]
+            with stage('assemble', len(new_antecedents)):
+                # replace antecedents with new names: шаблон со слотами антецедента и анафора
+                spans = sorted([
+                    (sample['antecedent']['start'], sample['antecedent']['end']),
+                    (sample['anaphor']['start'], sample['anaphor']['end']),
+                ])
+                template = TextTemplate.from_spans(sample['text'], spans)
+                antecedent_slot = spans.index((sample['antecedent']['start'], sample['antecedent']['end']))
+                for item in new_antecedents:
+                    values = list(template.slots)
+                    values[antecedent_slot] = item
+                    offsets = template.offsets(values)
+                    antecedent_start, antecedent_end = offsets[antecedent_slot]
+                    anaphor_start, anaphor_end = offsets[1 - antecedent_slot]
+                    new_texts.append({
+                        'text': template.render(values),
+                        'antecedent': {
+                            'text': item,
+                            'start': antecedent_start,
+                            'end': antecedent_end,
+                        },
+                        'anaphor': {
+                            'text': sample['anaphor']['text'],
+                            'start': anaphor_start,
+                            'end': anaphor_end,
+                        },
+                    })
         return new_texts
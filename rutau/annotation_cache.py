@@ -0,0 +1,235 @@
+"""Постоянный кэш разметки на диске
+
+Корпуса генерируются из одних и тех же текстов много раз с разными параметрами
+(типы сущностей, `shift`, способ разбиения), а NER и морфология при этом не меняются.
+Кэш хранит результаты разметки в SQLite по хэшу текста, версии моделей и виду разметки.
+Версия моделей по умолчанию - идентификатор моделей из реестра (`rutau.model_version`):
+при замене файлов моделей, пакетов или загрузчиков старые записи не используются:
+
+```
+from rutau import Anaphorate, Coref
+from rutau.annotation_cache import AnnotationCache
+
+cache = AnnotationCache('annotations.sqlite', max_bytes=2 * 1024 ** 3)
+anaphorate = Anaphorate(cache=cache)
+coref = Coref(cache=cache)
+```
+
+Значения - JSON. При превышении `max_bytes` удаляются записи, к которым дольше всего не обращались.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Какие модели реестра дают каждый вид разметки
+KIND_MODELS: Dict[str, List[str]] = {
+    'anaphorate.ner': ['ner'],
+    'coref.morph': ['natasha'],
+    'coref.ner': ['natasha'],
+}
+
+
+class AnnotationCache:
+    """Кэш разметки в файле SQLite
+
+    Один файл можно использовать из нескольких процессов: SQLite сам блокирует запись,
+    а после `fork` каждый процесс открывает своё соединение.
+    """
+    def __init__(self, path: str, max_bytes: Optional[int] = None, version: Optional[str] = None):
+        """
+        Args:
+            path (str): Путь к файлу базы.
+
+            max_bytes (Optional[int]): Предельный суммарный размер значений. По умолчанию - без ограничения.
+
+            version (Optional[str]): Версия моделей. Входит в ключ, поэтому при смене моделей
+            старые записи не используются (и со временем вытесняются). По умолчанию - версия `rutau`
+            и идентификаторы моделей реестра, которые дают вид разметки (см. `KIND_MODELS`).
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid = None
+        # Оценка суммарного размера: точный размер плюс вставленное с последнего подсчёта
+        self._size: Optional[int] = None
+        # Открываем базу сразу, чтобы ошибка в пути была видна при создании кэша
+        self._db
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        # Соединение SQLite нельзя использовать после fork: открываем своё в каждом процессе
+        if self._pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS annotations ('
+                'key BLOB PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)')
+            db.execute('CREATE INDEX IF NOT EXISTS annotations_accessed ON annotations (accessed)')
+            db.commit()
+            self._connection, self._pid, self._size = db, os.getpid(), None
+        return self._connection
+
+    def kind_version(self, kind: str) -> str:
+        """Версия моделей для вида разметки
+        """
+        if self.version is not None:
+            return self.version
+        from . import __version__, model_version
+        return '|'.join([__version__] + [model_version(name) for name in KIND_MODELS.get(kind, [])])
+
+    def key(self, kind: str, text: str, version: Optional[str] = None) -> bytes:
+        """Ключ записи: хэш версии моделей, вида разметки и текста
+        """
+        if version is None:
+            version = self.kind_version(kind)
+        return hashlib.blake2b(f'{version}\0{kind}\0{text}'.encode('utf-8'), digest_size=16).digest()
+
+    def get(self, kind: str, text: str) -> Optional[Any]:
+        return self.get_many(kind, [text]).get(text)
+
+    def get_many(self, kind: str, texts: Iterable[str]) -> Dict[str, Any]:
+        """Достаёт из кэша разметку текстов
+
+        Args:
+            kind (str): Вид разметки, например `anaphorate.ner` или `coref.morph`.
+
+            texts (Iterable[str]): Тексты.
+
+        Returns:
+            Dict[str, Any]: Текст -> разметка, только для найденных текстов
+        """
+        version = self.kind_version(kind)
+        keys = {self.key(kind, text, version): text for text in texts}
+        found: Dict[str, Any] = {}
+        if not keys:
+            return found
+        with self._lock:
+            key_list = list(keys)
+            # SQLite ограничивает число параметров запроса
+            for i in range(0, len(key_list), 500):
+                chunk = key_list[i:i+500]
+                rows = self._db.execute(
+                    f'SELECT key, value FROM annotations WHERE key IN ({",".join("?" * len(chunk))})',
+                    chunk).fetchall()
+                for key, value in rows:
+                    found[keys[key]] = json.loads(value)
+                if rows:
+                    now = time.time()
+                    self._db.executemany(
+                        'UPDATE annotations SET accessed = ? WHERE key = ?', [(now, key) for key, _ in rows])
+            self._db.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put(self, kind: str, text: str, value: Any) -> None:
+        self.put_many(kind, {text: value})
+
+    def put_many(self, kind: str, values: Dict[str, Any]) -> None:
+        """Сохраняет разметку текстов
+
+        Args:
+            kind (str): Вид разметки.
+
+            values (Dict[str, Any]): Текст -> разметка (сериализуемая в JSON).
+        """
+        if not values:
+            return
+        now = time.time()
+        version = self.kind_version(kind)
+        rows = []
+        for text, value in values.items():
+            value = json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+            rows.append((self.key(kind, text, version), value, len(value.encode('utf-8')), now))
+        with self._lock:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO annotations (key, value, size, accessed) VALUES (?, ?, ?, ?)', rows)
+            self._db.commit()
+        if self.max_bytes is None:
+            return
+        # Точный размер (полный проход по таблице) считаем, только когда оценка превысила предел:
+        # после вытеснения до 90% это происходит раз на 10% предела вставленных данных
+        if self._size is not None:
+            self._size += sum(row[2] for row in rows)
+        if self._size is None or self._size > self.max_bytes:
+            self._size = self.size()
+            if self._size > self.max_bytes:
+                self.evict(self.max_bytes)
+
+    def size(self) -> int:
+        """Суммарный размер значений в байтах
+        """
+        with self._lock:
+            return self._db.execute('SELECT COALESCE(SUM(size), 0) FROM annotations').fetchone()[0]
+
+    def evict(self, max_bytes: int) -> int:
+        """Удаляет самые давно использованные записи, пока размер кэша больше `max_bytes`
+
+        Чтобы не вытеснять по одной записи на каждой вставке, кэш сокращается до 90% предела.
+
+        Returns:
+            int: Сколько записей удалено
+        """
+        total = self.size()
+        if total <= max_bytes:
+            self._size = total
+            return 0
+        excess = total - int(max_bytes * 0.9)
+        with self._lock:
+            removed: List[Tuple[bytes]] = []
+            for key, size in self._db.execute('SELECT key, size FROM annotations ORDER BY accessed'):
+                if excess <= 0:
+                    break
+                removed.append((key,))
+                excess -= size
+                total -= size
+            self._db.executemany('DELETE FROM annotations WHERE key = ?', removed)
+            self._db.commit()
+        self._size = total
+        return len(removed)
+
+    def cache_info(self) -> Dict[str, Dict[str, int]]:
+        """Статистика обращений, как у `CachedMorphAnalyzer.cache_info`
+        """
+        with self._lock:
+            count = self._db.execute('SELECT COUNT(*) FROM annotations').fetchone()[0]
+        return {'annotations': {'hits': self.hits, 'misses': self.misses, 'size': count, 'maxsize': self.max_bytes}}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute('DELETE FROM annotations')
+            self._db.commit()
+        self._size = 0
+
+    def close(self) -> None:
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection, self._pid = None, None
+
+    def __enter__(self) -> 'AnnotationCache':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def from_environ() -> Optional[AnnotationCache]:
+    """Кэш, заданный переменными окружения, или None
+
+    `ANNOTATION_CACHE_PATH` - путь к файлу, `ANNOTATION_CACHE_MAX_BYTES` - предельный размер.
+    Переменные наследуются рабочими процессами, поэтому так кэш включается и в `rutau.parallel`.
+    """
+    path = os.environ.get('ANNOTATION_CACHE_PATH')
+    if not path:
+        return None
+    max_bytes = os.environ.get('ANNOTATION_CACHE_MAX_BYTES')
+    return AnnotationCache(path, max_bytes=int(max_bytes) if max_bytes else None)
@@ -0,0 +1,252 @@
+"""Векторы word2vec пониженной точности
+
+После `init_sims(replace=True)` матрица RusVectores хранится во float32, и это
+большая часть памяти процесса синонимизатора. Здесь нормированная матрица хранится:
+
+* `float16` - вдвое меньше;
+* `int8` с масштабом на строку - вчетверо меньше.
+
+Поиск соседей идёт прямо по компактной матрице: она переводится во float32 блоками
+по `block_size` строк, поэтому полная матрица float32 в памяти не появляется.
+Словарь можно дополнительно урезать по частотности и частям речи.
+
+Компактная модель строится один раз (`build_compact_w2v`) и сохраняется в папку:
+
+* `vocab.txt` - ключи словаря;
+* `vectors.npy` - матрица (float16 или int8);
+* `scales.npy` - масштабы строк (только для int8);
+* `meta.json` - тип, фильтры и полнота соседей относительно float32.
+"""
+import json
+import os
+import shutil
+from collections import namedtuple
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+DTYPES = ['float16', 'int8']
+
+VocabEntry = namedtuple('VocabEntry', ['index'])
+
+
+class CompactMatrix:
+    """Нормированная матрица векторов во float16 или int8 с масштабом на строку
+    """
+    def __init__(self, data: np.ndarray, scales: Optional[np.ndarray] = None, block_size: int = 65536):
+        """
+        Args:
+            data (np.ndarray): Матрица float16 или int8.
+
+            scales (Optional[np.ndarray]): Масштабы строк (float32) для int8.
+
+            block_size (int): Сколько строк переводить во float32 за раз при поиске.
+        """
+        if data.dtype == np.int8 and scales is None:
+            raise ValueError('int8 vectors need per-row scales')
+        self.data = data
+        self.scales = scales
+        self.block_size = block_size
+
+    @classmethod
+    def from_float(cls, vectors: np.ndarray, dtype: str = 'float16', batch_size: int = 65536) -> 'CompactMatrix':
+        """Сжимает матрицу float32
+
+        Args:
+            vectors (np.ndarray): Нормированная матрица векторов.
+
+            dtype (str): `float16` или `int8`.
+
+            batch_size (int): Сколько строк сжимать за раз.
+
+        Returns:
+            CompactMatrix: Сжатая матрица
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f'Unknown dtype: {dtype}')
+        if dtype == 'float16':
+            return cls(np.asarray(vectors, dtype=np.float16))
+        data = np.zeros(vectors.shape, dtype=np.int8)
+        scales = np.zeros(len(vectors), dtype=np.float32)
+        for start in range(0, len(vectors), batch_size):
+            block = np.asarray(vectors[start:start+batch_size], dtype=np.float32)
+            block_scales = np.abs(block).max(axis=1) / 127
+            block_scales[block_scales == 0] = 1
+            data[start:start+batch_size] = np.round(block / block_scales[:, None])
+            scales[start:start+batch_size] = block_scales
+        return cls(data, scales)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.data.shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, rows) -> 'CompactMatrix':
+        """Подматрица из строк `rows` (копия)
+        """
+        scales = self.scales[rows] if self.scales is not None else None
+        return CompactMatrix(self.data[rows], scales, self.block_size)
+
+    def rows(self, indexes: np.ndarray) -> np.ndarray:
+        """Строки матрицы во float32
+        """
+        rows = self.data[indexes].astype(np.float32)
+        if self.scales is not None:
+            rows *= self.scales[indexes][:, None]
+        return rows
+
+    def similarities(self, indexes: np.ndarray) -> np.ndarray:
+        """Косинусные близости строк `indexes` ко всем строкам матрицы
+
+        Returns:
+            np.ndarray: Матрица float32 (len(indexes), len(self))
+        """
+        queries = self.rows(indexes)
+        sims = np.empty((len(indexes), len(self.data)), dtype=np.float32)
+        for start in range(0, len(self.data), self.block_size):
+            stop = min(start + self.block_size, len(self.data))
+            block = self.data[start:stop].astype(np.float32)
+            sims[:, start:stop] = np.dot(queries, block.T)
+            if self.scales is not None:
+                sims[:, start:stop] *= self.scales[start:stop]
+        return sims
+
+
+class CompactKeyedVectors:
+    """Модель word2vec со сжатой матрицей и интерфейсом, который нужен `Synonimizer`:
+    `vocab[key].index`, `index2word`, `vectors_norm`
+    """
+    def __init__(self, index2word: List[str], vectors: CompactMatrix, meta: Optional[Dict[str, Any]] = None):
+        self.index2word = index2word
+        self.vocab = {word: VocabEntry(i) for i, word in enumerate(index2word)}
+        self.vectors = self.vectors_norm = vectors
+        self.meta = meta or {}
+
+    @classmethod
+    def from_keyed_vectors(cls, w2v_model, dtype: str = 'float16', max_rank: Optional[int] = None,
+                           pos: Optional[List[str]] = None) -> 'CompactKeyedVectors':
+        """Сжимает модель gensim
+
+        Args:
+            w2v_model (KeyedVectors): Модель word2vec с нормированными векторами.
+
+            dtype (str): `float16` или `int8`.
+
+            max_rank (Optional[int]): Оставить только столько самых частотных слов словаря.
+
+            pos (Optional[List[str]]): Оставить только ключи с этими частями речи, например `['NOUN', 'VERB']`.
+
+        Returns:
+            CompactKeyedVectors: Сжатая модель
+        """
+        # Словарь gensim отсортирован по убыванию частоты
+        index2word = w2v_model.index2word[:max_rank]
+        rows = [i for i, word in enumerate(index2word)
+                if pos is None or word.rsplit('_', 1)[-1] in pos]
+        vectors = w2v_model.vectors_norm
+        if len(rows) < len(w2v_model.index2word):
+            vectors = vectors[rows]
+        meta = {'dtype': dtype, 'max_rank': max_rank, 'pos': pos, 'size': len(rows)}
+        return cls([index2word[i] for i in rows], CompactMatrix.from_float(vectors, dtype), meta)
+
+    def most_similar(self, key: str, topn: int = 10) -> List[Tuple[str, float]]:
+        """Соседи ключа по убыванию близости
+        """
+        from .neighbours import most_similar_rows
+        ids, scores = most_similar_rows(self.vectors_norm, np.array([self.vocab[key].index]), topn)
+        return [(self.index2word[i], float(score)) for i, score in zip(ids[0].tolist(), scores[0].tolist())]
+
+    def save(self, path: str) -> None:
+        """Сохраняет модель в папку `path`
+
+        Модель пишется во временную папку и переименовывается: параллельный запуск
+        не увидит наполовину записанную модель. Старая модель в `path` заменяется.
+        """
+        path = os.path.normpath(path)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        if os.path.isdir(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        with open(os.path.join(tmp_path, 'vocab.txt'), 'w', encoding='utf-8') as fp:
+            fp.write('\n'.join(self.index2word))
+        np.save(os.path.join(tmp_path, 'vectors.npy'), self.vectors.data)
+        if self.vectors.scales is not None:
+            np.save(os.path.join(tmp_path, 'scales.npy'), self.vectors.scales)
+        with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as fp:
+            json.dump(self.meta, fp, ensure_ascii=False, indent=2)
+        # Папку нельзя заменить непустой: старую модель сначала переименовываем.
+        # Процессы, которые уже открыли её через memory-mapping, продолжают ею пользоваться
+        old_path = f'{path}.{os.getpid()}.old'
+        if os.path.isdir(path):
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        if os.path.isdir(old_path):
+            shutil.rmtree(old_path)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'CompactKeyedVectors':
+        """Загружает модель из папки `path`
+
+        Args:
+            path (str): Папка с моделью.
+
+            mmap (bool): Открыть матрицы через memory-mapping только для чтения.
+
+        Returns:
+            CompactKeyedVectors: Сжатая модель
+        """
+        with open(os.path.join(path, 'vocab.txt'), encoding='utf-8') as fp:
+            index2word = fp.read().split('\n')
+        mmap_mode = 'r' if mmap else None
+        data = np.load(os.path.join(path, 'vectors.npy'), mmap_mode=mmap_mode)
+        scales = None
+        if os.path.isfile(os.path.join(path, 'scales.npy')):
+            scales = np.load(os.path.join(path, 'scales.npy'), mmap_mode=mmap_mode)
+        elif data.dtype == np.int8:
+            raise ValueError(f'{path}: int8 model has no scales.npy, rebuild it with rutau.build_compact_w2v')
+        meta = {}
+        if os.path.isfile(os.path.join(path, 'meta.json')):
+            with open(os.path.join(path, 'meta.json'), encoding='utf-8') as fp:
+                meta = json.load(fp)
+        return cls(index2word, CompactMatrix(data, scales), meta)
+
+
+def neighbour_recall(w2v_model, compact: CompactKeyedVectors, topn: int = 10, sample: int = 1000,
+                     seed: int = 0) -> float:
+    """Полнота соседей сжатой модели относительно полной точности
+
+    Для случайных ключей сравниваются `topn` соседей по float32 (в пределах словаря
+    сжатой модели) и по сжатой матрице.
+
+    Args:
+        w2v_model (KeyedVectors): Исходная модель с нормированными векторами.
+
+        compact (CompactKeyedVectors): Сжатая модель.
+
+        topn (int): Количество соседей.
+
+        sample (int): Сколько ключей проверять.
+
+        seed (int): Зерно выбора ключей.
+
+    Returns:
+        float: Средняя доля общих соседей, от 0 до 1
+    """
+    from .neighbours import most_similar_rows
+    rows = np.array([w2v_model.vocab[word].index for word in compact.index2word])
+    full = np.asarray(w2v_model.vectors_norm[rows], dtype=np.float32)
+    random = np.random.RandomState(seed)
+    indexes = random.choice(len(rows), size=min(sample, len(rows)), replace=False)
+    overlap = 0
+    for start in range(0, len(indexes), 256):
+        batch = indexes[start:start+256]
+        expected, _ = most_similar_rows(full, batch, topn)
+        found, _ = most_similar_rows(compact.vectors_norm, batch, topn)
+        for a, b in zip(expected.tolist(), found.tolist()):
+            overlap += len(set(a) & set(b)) / max(len(a), 1)
+    return overlap / max(len(indexes), 1)
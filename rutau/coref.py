@@ -1,12 +1,18 @@
-from typing import Tuple, List, Dict
-import pymorphy2
+from typing import TYPE_CHECKING, Tuple, List, Dict, Iterable, Iterator, Optional, Union
 from razdel import tokenize
 import os
 import random
+from collections import OrderedDict
 from dataclasses import dataclass
-import pymorphy2
-from natasha import Doc, Segmenter, MorphVocab
-from natasha import NewsEmbedding, NewsMorphTagger, NewsNERTagger
+from . import get_model, with_batch_size, chunked
+from .document import Document, as_document
+from .instrument import stage
+from .pronouns import pronoun_from_feats
+
+# natasha импортируется при создании первого документа, чтобы `CorefItem` был лёгким
+if TYPE_CHECKING:
+    from natasha import Doc
+    from .annotation_cache import AnnotationCache
 
 
 @dataclass
@@ -21,130 +27,201 @@ class CorefItem:
 class Coref:
     """Находит несколько кореферентностей в тексте
     """
-    def __init__(self):
-        self.morph = pymorphy2.MorphAnalyzer()
-        self.segmenter = Segmenter()
-        self.morph_vocab = MorphVocab()
-        self.emb = NewsEmbedding()
-        self.morph_tagger = NewsMorphTagger(self.emb)
-        self.ner_tagger = NewsNERTagger(self.emb)
+    def __init__(self, cache: Optional['AnnotationCache'] = None):
+        '''
+        Args:
+            cache (Optional[AnnotationCache]): Постоянный кэш морфологии и NER-разметки
+            (см. `rutau.annotation_cache`).
+        '''
+        self.cache = cache
+        self.morph = get_model('morph')
+        natasha = get_model('natasha')
+        self.segmenter = natasha['segmenter']
+        self.morph_vocab = natasha['morph_vocab']
+        self.emb = natasha['emb']
+        self.morph_tagger = natasha['morph_tagger']
+        self.ner_tagger = natasha['ner_tagger']
         
-    def select_corefs(self, text: str) -> Tuple[List]:
+    def annotate(self, text: Union[str, Document]) -> 'Doc':
+        '''Сегментация, морфология, лемматизация и NER текста.
+
+        Для `Document` разметка natasha считается один раз и хранится в слое `natasha`.
+        '''
+        document = as_document(text)
+        return document.layer('natasha', lambda: self.annotate_docs([document], self.morph_tagger, self.ner_tagger)[0])
+
+    def annotate_many(self, texts: Iterable[Union[str, Document]], batch_size: int = 32) -> Iterator['Doc']:
+        '''То же, что `annotate`, но для потока текстов.
+
+        Предложения и тексты из `batch_size` документов размечаются теггерами батчами,
+        документы отдаются в порядке входных текстов.
+        '''
+        morph_tagger = with_batch_size(self.morph_tagger, batch_size)
+        ner_tagger = with_batch_size(self.ner_tagger, batch_size)
+        for chunk in chunked(texts, batch_size):
+            documents = [as_document(text) for text in chunk]
+            missing = [document for document in documents if 'natasha' not in document]
+            for document, doc in zip(missing, self.annotate_docs(missing, morph_tagger, ner_tagger)):
+                document.layers['natasha'] = doc
+            for document in documents:
+                yield document.layers['natasha']
+
+    def annotate_docs(self, texts: List[Union[str, Document]], morph_tagger, ner_tagger) -> List['Doc']:
+        '''Размечает пакет текстов заданными теггерами.
+
+        Если задан кэш, морфология предложений и NER-сущности текстов берутся из него,
+        а теггеры запускаются только для остального. Документы natasha сегментируются
+        по предложениям и токенам `Document`, поэтому razdel для них повторно не запускается.
+        '''
+        from natasha.doc import DocSpan
+        with stage('tokenize', len(texts)):
+            docs = [as_document(text).natasha_doc() for text in texts]
+
+        sents = [sent for doc in docs for sent in doc.sents]
+        with stage('morph', len(sents)):
+            morph = self._cached('coref.morph', [sent.text for sent in sents])
+            # Запись кэша подходит, только если сегментатор разбил предложение так же
+            missing = {sent.text: [token.text for token in sent.tokens] for sent in sents
+                       if sent.text not in morph or len(morph[sent.text]) != len(sent.tokens)}
+            markups = morph_tagger.map(list(missing.values()))
+            for text, markup in zip(missing, markups):
+                morph[text] = [[token.pos, token.feats] for token in markup.tokens]
+            self._store('coref.morph', {text: morph[text] for text in missing})
+            for sent in sents:
+                for token, (pos, feats) in zip(sent.tokens, morph[sent.text]):
+                    token.pos = pos
+                    token.feats = feats
+            for doc in docs:
+                for token in doc.tokens:
+                    token.lemmatize(self.morph_vocab)
+
+        ner_docs = [doc for doc in docs if doc.text.strip()]
+        with stage('ner', len(ner_docs)):
+            spans = self._cached('coref.ner', [doc.text for doc in ner_docs])
+            missing = [text for text in dict.fromkeys(doc.text for doc in ner_docs) if text not in spans]
+            for text, markup in zip(missing, ner_tagger.map(missing)):
+                spans[text] = [[span.start, span.stop, span.type] for span in markup.spans]
+            self._store('coref.ner', {text: spans[text] for text in missing})
+            for doc in docs:
+                doc.spans = []
+            for doc in ner_docs:
+                doc.spans = [DocSpan(start, stop, type, doc.text[start:stop])
+                             for start, stop, type in spans[doc.text]]
+                doc.envelop_span_tokens()
+                doc.envelop_sent_spans()
+        return docs
+
+    def _cached(self, kind: str, texts: List[str]) -> Dict:
+        return self.cache.get_many(kind, texts) if self.cache is not None else {}
+
+    def _store(self, kind: str, values: Dict) -> None:
+        if self.cache is not None:
+            self.cache.put_many(kind, values)
+
+    def select_corefs(self, text: Union[str, Document]) -> Tuple[List]:
         '''Метод извлекает из текста кореферентности на основе NER.
         '''
-        doc = Doc(text)
-        doc.segment(self.segmenter)
-        doc.tag_morph(self.morph_tagger)
-        for token in doc.tokens:
-            token.lemmatize(self.morph_vocab)
-        doc.tag_ner(self.ner_tagger)
-
-        # Извлекаем леммы и ищем встречающиеся NER-сущности
-        extracted_lemmas = {}
+        return self.doc_corefs(self.annotate(text))
+
+    def doc_corefs(self, doc: 'Doc') -> Tuple[List]:
+        '''Метод извлекает кореферентности из уже размеченного документа.
+        '''
+        # Индекс лемма -> вхождения в NER-сущности в порядке текста
+        occurrences: Dict[str, List] = {}
         for span in doc.spans:
             for token in span.tokens:
-                if token.lemma in extracted_lemmas:
-                    extracted_lemmas[token.lemma] += 1
-                else:
-                    extracted_lemmas[token.lemma] = 1
-        selected_items = [item for item in extracted_lemmas if extracted_lemmas[item] > 1]
+                occurrences.setdefault(token.lemma, []).append(span)
 
-        # Выбираем антецеденты и упоминания
+        # Выбираем антецеденты (первое вхождение) и упоминания (остальные)
         coref_sequence = []
-        for item in selected_items:
-            antecedent_found = -100
-            for span in doc.spans:
-                for token in span.tokens:
-                    if token.lemma == item:
-                        if antecedent_found == -100:
-                            antecedent_found = span.start
-                            coref_sequence.append(CorefItem(
-                                span.text,
-                                token.lemma,
-                                span.type,
-                                span.start,
-                                span.stop))
-                        else:
-                            coref_sequence.append(CorefItem(
-                                span.text,
-                                token.lemma,
-                                span.type,
-                                span.start,
-                                span.stop, antecedent_found))
+        for lemma, spans in occurrences.items():
+            if len(spans) < 2:
+                continue
+            antecedent_found = spans[0].start
+            coref_sequence.append(CorefItem(
+                spans[0].text,
+                lemma,
+                spans[0].type,
+                spans[0].start,
+                spans[0].stop))
+            for span in spans[1:]:
+                coref_sequence.append(CorefItem(
+                    span.text,
+                    lemma,
+                    span.type,
+                    span.start,
+                    span.stop, antecedent_found))
 
         # Обзначаем индексы токенов
         sequence = [token for token in doc.tokens]
-        indexes = {}
-        for item in coref_sequence:
-            for i, token in enumerate(doc.tokens):
-                if item.start == token.start:
-                    indexes[item.start] = i
-                    item.start = i
-                if item.stop == token.stop:
-                    item.stop = i
-
+        starts = {token.start: i for i, token in enumerate(doc.tokens)}
+        stops = {token.stop: i for i, token in enumerate(doc.tokens)}
         for item in coref_sequence:
             if item.coref != -100:
-                item.coref = indexes[item.coref]
+                item.coref = starts[item.coref]
+            item.start = starts.get(item.start, item.start)
+            item.stop = stops.get(item.stop, item.stop)
         return sequence, coref_sequence
 
-    def get_pronoun(self, doc_token: Doc) -> str:
+    def get_pronoun(self, doc_token: 'Doc') -> str:
         '''Преобразует слово в местоимение
         '''
-        # https://pymorphy2.readthedocs.io/en/latest/user/grammemes.html#grammeme-docs
-        cases = {
-            'Acc': 'accs',
-            'Dat': 'datv',
-            'Gen': 'gent',
-            'Ins': 'ablt', 
-            'Loc': 'loct', 
-            'Nom': 'nomn',
-        }
-
-        feats = doc_token.feats
-
-        try:
-            if 'Number' in feats and feats['Number'] == 'Plur':
-                pronoun = 'они'
-            elif feats['Gender'] == 'Masc':
-                pronoun = 'он'
-            elif feats['Gender'] == 'Fem':
-                pronoun = 'она'
-            else:
-                pronoun = 'оно'
-
-            tagset = set()
-            if 'Case' in feats:
-                tagset.add(cases[feats['Case']])
-
-            pronoun = self.morph.parse(pronoun)[0]
-            pronoun = pronoun.inflect(tagset).word
-        except:
-            pronoun = 'он'
-        return pronoun
+        with stage('pronoun'):
+            return pronoun_from_feats(doc_token.feats)
     
-    def replace_with_pronouns(self, sequence: Doc, coref_sequence: List, shift: bool = True) -> Tuple[List]:
+    def replace_with_pronouns(self, sequence: 'Doc', coref_sequence: List, shift: bool = True) -> Tuple[List]:
         '''Заменяем упоминания местоимениями
+
+        Упоминание (в том числе из нескольких токенов) заменяется одним местоимением.
+        При `shift` местоимение переставляется на позицию перед предыдущим токеном.
+        Индексы всех элементов `coref_sequence` пересчитываются под новую последовательность.
         '''
-        new_sequence = [token.text for token in sequence]
-        start, stop, offset = 0, 0, 0
-        for mention in coref_sequence:
-            if mention.coref == -100:
-                pass
+        # Планируем замены: начало упоминания -> (конец, местоимение), пересекающиеся пропускаем
+        replacements: Dict[int, Tuple[int, str]] = {}
+        mentions_by_start: Dict[int, List[CorefItem]] = {}
+        last_stop = -1
+        for mention in sorted((m for m in coref_sequence if m.coref != -100), key=lambda m: m.start):
+            if mention.start in replacements and replacements[mention.start][0] == mention.stop:
+                mentions_by_start[mention.start].append(mention)
+            elif mention.start > last_stop and 0 <= mention.start <= mention.stop < len(sequence):
+                replacements[mention.start] = (mention.stop, self.get_pronoun(sequence[mention.start]))
+                mentions_by_start[mention.start] = [mention]
+                last_stop = mention.stop
+
+        # Один проход: собираем новую последовательность и запоминаем, откуда пришёл каждый элемент
+        new_sequence: List[str] = []
+        origins: List[Tuple[int, int]] = []
+        i = 0
+        while i < len(sequence):
+            if i in replacements:
+                stop, pronoun = replacements[i]
+                new_sequence.append(pronoun)
+                origins.append((i, stop))
+                if shift and len(new_sequence) > 1:
+                    new_sequence[-2], new_sequence[-1] = new_sequence[-1], new_sequence[-2]
+                    origins[-2], origins[-1] = origins[-1], origins[-2]
+                i = stop + 1
             else:
-                if mention.start == mention.stop:
-                    current_start = mention.start
-                    current_stop = mention.stop+1
-                    pronoun = self.get_pronoun(sequence[mention.start])
-                    mention.token = pronoun
-                    if shift == True:
-                        mention.start = mention.start - 1
-                        mention.stop = mention.stop - 1
-                        new_sequence = new_sequence[:current_start-1] + [pronoun] \
-                        + new_sequence[current_start-1:current_start] + new_sequence[current_start+1:]
-                    else:
-                        new_sequence = new_sequence[:current_start] + [pronoun] + new_sequence[current_stop:]
+                new_sequence.append(sequence[i].text)
+                origins.append((i, i))
+                i += 1
+
+        new_index = [0] * len(sequence)
+        for position, (start, stop) in enumerate(origins):
+            for old in range(start, stop + 1):
+                new_index[old] = position
+
+        def remap(index: int) -> int:
+            return new_index[index] if 0 <= index < len(new_index) else index
 
+        for item in coref_sequence:
+            item.start = remap(item.start)
+            item.stop = remap(item.stop)
+            if item.coref != -100:
+                item.coref = remap(item.coref)
+        for start, (stop, pronoun) in replacements.items():
+            for mention in mentions_by_start[start]:
+                mention.token = pronoun
         return new_sequence, coref_sequence
     
     def coref_to_dict(self, coref_sequence: List[CorefItem]) -> List[Dict]:
@@ -169,10 +246,13 @@ class Coref:
                     'end': itm.stop,
                     'coref': itm.coref,
                 })
+        mentions_by_coref: Dict[int, List] = {}
+        for m in ments:
+            mentions_by_coref.setdefault(m['coref'], []).append(m)
         for a in ants:
             coreferense.append({
                 'antecedent': a,
-                'mentions': [m for m in ments if m['coref'] == a['start']]
+                'mentions': list(mentions_by_coref.get(a['start'], []))
             })
         return coreferense
     
@@ -211,16 +291,102 @@ class Coref:
             })
         return corpus
     
-    def get_anaphoras(self, text: str, shift: bool = True) -> Tuple[List]:
+    def get_anaphoras(self, text: Union[str, Document], shift: bool = True) -> Tuple[List]:
         """Связи: имя собственное + несколько упоминаний-местоимений.
         """
+        return self.doc_anaphoras(self.annotate(text), shift=shift)
+
+    def get_anaphoras_many(self, texts: Iterable[Union[str, Document]], shift: bool = True, batch_size: int = 32) -> Iterator[List]:
+        """То же, что `get_anaphoras`, но для потока текстов с батчевой разметкой.
+
+        Результаты отдаются в порядке входных текстов.
+        """
+        for doc in self.annotate_many(texts, batch_size=batch_size):
+            yield self.doc_anaphoras(doc, shift=shift)
+
+    def doc_anaphoras(self, doc: 'Doc', shift: bool = True) -> List:
+        """Связи для уже размеченного документа.
+        """
         corpus: List = []
-        sequence, coref_sequence = self.select_corefs(text)
-        if len(coref_sequence) == 0:
-            return corpus
-        sequence, coref_sequence = self.replace_with_pronouns(sequence, coref_sequence, shift=shift)
-        corpus.append({
-            'sequence': sequence,
-            'coreferences': self.coref_to_dict(coref_sequence)
-        })
-        return corpus
\ No newline at end of file
+        with stage('assemble'):
+            sequence, coref_sequence = self.doc_corefs(doc)
+            if len(coref_sequence) == 0:
+                return corpus
+            sequence, coref_sequence = self.replace_with_pronouns(sequence, coref_sequence, shift=shift)
+            corpus.append({
+                'sequence': sequence,
+                'coreferences': self.coref_to_dict(coref_sequence)
+            })
+        return corpus
+
+    def stream_corefs(self, texts: Union[str, Document, Iterable[Union[str, Document]]], window: int = 32, overlap: int = 4,
+                      max_antecedents: int = 100000) -> Iterator[Dict]:
+        """Потоковый поиск кореферентностей в очень длинных документах.
+
+        Документ размечается окнами по `window` предложений, соседние окна перекрываются
+        на `overlap` предложений (они дают контекст NER и не обрабатываются повторно).
+        Антецеденты (первое упоминание леммы) переносятся между окнами в таблице
+        не больше `max_antecedents` лемм: давно не встречавшиеся вытесняются.
+        Память ограничена размером окна и таблицы, а не длиной документа.
+
+        Args:
+            texts (Union[str, Document, Iterable[Union[str, Document]]]): Текст или поток его частей
+            (например, абзацев файла); предложения `Document` берутся из его разметки.
+
+            window (int): Размер окна в предложениях.
+
+            overlap (int): На сколько предложений перекрываются соседние окна.
+
+            max_antecedents (int): Максимальный размер таблицы антецедентов.
+
+        Yields:
+            Dict: Связь `{'antecedent': ..., 'mention': ...}` в формате `coref_to_dict`,
+            `start`, `end` и `coref` - глобальные индексы токенов документа
+        """
+        if not 0 <= overlap < window:
+            raise ValueError('overlap must be non-negative and smaller than window')
+        if isinstance(texts, (str, Document)):
+            texts = [texts]
+        sents_stream = (sent for text in texts for sent in as_document(text).sent_texts)
+        antecedents: 'OrderedDict[str, Dict]' = OrderedDict()
+        context: List[str] = []
+        # Глобальный индекс первого токена, ещё не обработанного в предыдущих окнах
+        position = 0
+        for chunk in chunked(sents_stream, window - overlap):
+            sents = context + chunk
+            doc = self.annotate_docs([' '.join(sents)], self.morph_tagger, self.ner_tagger)[0]
+            # Начало новых предложений в тексте окна: до него - перекрытие
+            new_from = sum(len(sent) + 1 for sent in context)
+            starts = {token.start: i for i, token in enumerate(doc.tokens)}
+            first_new = sum(1 for token in doc.tokens if token.start < new_from)
+            offset = position - first_new
+            for span in doc.spans:
+                if span.start < new_from or not span.tokens:
+                    continue
+                start = offset + starts[span.tokens[0].start]
+                stop = offset + starts[span.tokens[-1].start]
+                for token in span.tokens:
+                    antecedent = antecedents.get(token.lemma)
+                    if antecedent is None:
+                        antecedents[token.lemma] = {
+                            'token': span.text,
+                            'lemma': token.lemma,
+                            'start': start,
+                            'end': stop,
+                        }
+                        if len(antecedents) > max_antecedents:
+                            antecedents.popitem(last=False)
+                        continue
+                    antecedents.move_to_end(token.lemma)
+                    yield {
+                        'antecedent': dict(antecedent),
+                        'mention': {
+                            'token': span.text,
+                            'lemma': token.lemma,
+                            'start': start,
+                            'end': stop,
+                            'coref': antecedent['start'],
+                        },
+                    }
+            position = offset + len(doc.tokens)
+            context = sents[len(sents) - overlap:] if overlap else []
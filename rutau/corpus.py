@@ -0,0 +1,280 @@
+"""Потоковое чтение корпусов и запись сгенерированных сэмплов в JSONL
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+import sys
+from contextlib import ExitStack
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, Optional, TextIO
+from . import chunked
+
+if TYPE_CHECKING:
+    from multiprocessing.pool import Pool
+    from .dedup import Deduplicator
+
+METHODS = ['anaphorate', 'pronouns', 'coref', 'synonymize', 'rename']
+
+
+def open_text(path: str, mode: str = 'r') -> TextIO:
+    """Открывает текстовый файл, `.gz` - со сжатием gzip, `-` - stdin/stdout
+    """
+    if path == '-':
+        return sys.stdin if 'r' in mode else sys.stdout
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def detect_format(path: str) -> str:
+    """Определяет формат входного корпуса по пути: `dir`, `jsonl` или `lines`
+    """
+    if os.path.isdir(path):
+        return 'dir'
+    if path.endswith('.jsonl') or path.endswith('.jsonl.gz'):
+        return 'jsonl'
+    return 'lines'
+
+
+def read_corpus(path: str, format: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Читает входной корпус потоком
+
+    Args:
+        path (str): Путь к файлу или папке.
+
+        format (Optional[str]): Формат корпуса. По умолчанию определяется по пути.
+            * `lines` - один текст на строку
+            * `jsonl` - одна JSON-запись на строку, текст в поле `text`
+            * `dir` - папка, один текст на файл
+
+    Yields:
+        Dict[str, Any]: Запись с полем `text` (для `dir` - ещё и `id` с именем файла)
+    """
+    format = format or detect_format(path)
+    if format == 'dir':
+        for name in sorted(os.listdir(path)):
+            if os.path.isfile(os.path.join(path, name)):
+                with open_text(os.path.join(path, name)) as fp:
+                    yield {'id': name, 'text': fp.read()}
+    elif format == 'jsonl':
+        with open_text(path) as fp:
+            for line in fp:
+                if line.strip():
+                    yield json.loads(line)
+    elif format == 'lines':
+        with open_text(path) as fp:
+            for line in fp:
+                line = line.rstrip('\n')
+                if line.strip():
+                    yield {'text': line}
+    else:
+        raise ValueError(f'Unknown corpus format: {format}')
+
+
+class JsonlWriter:
+    """Пишет сэмплы в JSONL по одному, не накапливая их в памяти
+
+    Если путь оканчивается на `.gz` или указан `compress`, файл сжимается gzip.
+    """
+    def __init__(self, path: str, compress: bool = False):
+        self.path = path
+        self.count = 0
+        if compress and path != '-' and not path.endswith('.gz'):
+            self.fp = io.TextIOWrapper(gzip.open(path, 'wb'), encoding='utf-8')
+        else:
+            self.fp = open_text(path, 'w')
+
+    def write(self, sample: Dict[str, Any]) -> None:
+        self.fp.write(json.dumps(sample, ensure_ascii=False) + '\n')
+        self.count += 1
+
+    def write_many(self, samples: Iterable[Dict[str, Any]]) -> int:
+        for sample in samples:
+            self.write(sample)
+        return self.count
+
+    def close(self) -> None:
+        if self.fp is sys.stdout:
+            self.fp.flush()
+        else:
+            self.fp.close()
+
+    def __enter__(self) -> 'JsonlWriter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def iter_samples(records: Iterable[Dict[str, Any]], method: str, workers: int = 0,
+                 batch_size: int = 32, pool: Optional['Pool'] = None,
+                 options: Optional[Dict[str, Any]] = None, **kwargs) -> Iterator[Dict[str, Any]]:
+    """Применяет генератор к потоку записей и отдаёт сэмплы по одному
+
+    Args:
+        records (Iterable[Dict[str, Any]]): Входные записи с полем `text`
+        (для `rename` - уже размеченные сэмплы).
+
+        method (str): Генератор:
+            * `anaphorate` - `Anaphorate.anaphorate`
+            * `pronouns` - `Anaphorate.find_pronoun_pairs`
+            * `coref` - `Coref.get_anaphoras`
+            * `synonymize` - `Synonimizer.synonimize_text`
+            * `rename` - `Anaphorate.rename_antecedent`
+
+        workers (int): Количество процессов для `anaphorate`, `coref`, `synonymize`
+        (см. `rutau.parallel`). 0 - в текущем процессе.
+
+        batch_size (int): Размер пачки текстов.
+
+        pool (Optional[Pool]): Открытый пул рабочих процессов (см. `rutau.parallel.open_pool`).
+        По умолчанию при `workers` пул создаётся на время вызова.
+
+        options (Optional[Dict[str, Any]]): Параметры конструктора генератора,
+        например `{'vectors': 'int8'}` для `synonymize` (см. `rutau.parallel.get_generator`).
+
+        kwargs: Параметры генератора.
+
+    Yields:
+        Dict[str, Any]: Сгенерированные сэмплы
+    """
+    if method not in METHODS:
+        raise ValueError(f'Unknown method: {method}')
+    from .parallel import generate, get_generator
+
+    if method in ['pronouns', 'rename']:
+        anaphorate = get_generator('anaphorate')
+        for record in records:
+            if method == 'pronouns':
+                yield from anaphorate.find_pronoun_pairs(record['text'])
+            else:
+                yield from anaphorate.rename_antecedent([record], **kwargs)
+        return
+
+    texts = (record['text'] for record in records)
+    if workers > 0:
+        if method in ['anaphorate', 'coref']:
+            kwargs['batch_size'] = batch_size
+        results = generate(texts, method, processes=workers, chunk_size=batch_size, pool=pool,
+                           options=options, **kwargs)
+    elif method == 'anaphorate':
+        results = get_generator(method, options).anaphorate_many(texts, batch_size=batch_size, **kwargs)
+    elif method == 'coref':
+        results = get_generator(method, options).get_anaphoras_many(texts, batch_size=batch_size, **kwargs)
+    else:
+        synonimizer = get_generator(method, options)
+        results = (result for chunk in chunked(texts, batch_size)
+                   for result in synonimizer.synonimize_texts(chunk, **kwargs))
+
+    for result in results:
+        if method == 'synonymize':
+            for text in result:
+                yield {'text': text}
+        else:
+            yield from result
+
+
+def load_manifest(output_dir: str) -> Optional[Dict[str, Any]]:
+    """Читает манифест шардированного запуска, если он есть
+    """
+    path = os.path.join(output_dir, 'manifest.json')
+    if not os.path.isfile(path):
+        return None
+    with open(path, encoding='utf-8') as fp:
+        return json.load(fp)
+
+
+def save_manifest(output_dir: str, manifest: Dict[str, Any]) -> None:
+    """Атомарно записывает манифест шардированного запуска
+    """
+    path = os.path.join(output_dir, 'manifest.json')
+    with open(path + '.tmp', 'w', encoding='utf-8') as fp:
+        json.dump(manifest, fp, ensure_ascii=False, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def records_fingerprint(records: Iterable[Dict[str, Any]]) -> str:
+    """Хэш входных записей шарда: при продолжении запуска так проверяется, что вход не изменился
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for record in records:
+        digest.update(json.dumps(record, ensure_ascii=False, sort_keys=True).encode('utf-8') + b'\n')
+    return digest.hexdigest()
+
+
+def run_sharded(records: Iterable[Dict[str, Any]], output_dir: str, method: str, shard_size: int = 1000,
+                compress: bool = False, dedup: Optional['Deduplicator'] = None, **kwargs) -> Dict[str, Any]:
+    """Генерация с контрольными точками: вход режется на шарды по `shard_size` записей
+
+    Каждый шард пишется во временный файл и переименовывается после завершения,
+    после чего отмечается в `manifest.json`. При повторном запуске с тем же входом
+    готовые шарды пропускаются, и генерация продолжается с первого незавершённого.
+    Манифест хранит параметры генератора, сжатие и хэш входа каждого шарда: продолжить
+    запуск с другими параметрами или на изменившемся корпусе нельзя.
+
+    Args:
+        records (Iterable[Dict[str, Any]]): Входные записи (см. `read_corpus`).
+
+        output_dir (str): Папка для шардов и манифеста.
+
+        method (str): Генератор (см. `iter_samples`).
+
+        shard_size (int): Количество входных записей в шарде.
+
+        compress (bool): Сжимать шарды gzip.
+
+        dedup (Optional[Deduplicator]): Фильтр повторов (см. `rutau.dedup`). При продолжении
+        запуска сэмплы готовых шардов читаются в него заново, и повторы отсекаются по всему запуску.
+
+        kwargs: Параметры `iter_samples` и генератора.
+
+    Returns:
+        Dict[str, Any]: Манифест запуска
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    # Параметры, от которых зависят сэмплы (число процессов и размер пачки на них не влияют)
+    params = json.loads(json.dumps({key: value for key, value in kwargs.items()
+                                    if key not in ['workers', 'batch_size']}, sort_keys=True))
+    settings = {'method': method, 'shard_size': shard_size, 'compress': compress, 'params': params}
+    manifest = load_manifest(output_dir)
+    if manifest is None:
+        manifest = dict(settings, shards={})
+    else:
+        previous = {key: manifest.get(key) for key in settings}
+        if previous != settings:
+            raise ValueError(f'{output_dir} was generated with other settings: {previous}, now: {settings}')
+
+    # Один пул рабочих процессов на все шарды: открывается у первого незавершённого шарда
+    workers = kwargs.get('workers', 0)
+    pool = None
+    with ExitStack() as stack:
+        for num, chunk in enumerate(chunked(records, shard_size)):
+            name = f'shard-{num:05d}.jsonl' + ('.gz' if compress else '')
+            fingerprint = records_fingerprint(chunk)
+            done = manifest['shards'].get(name)
+            if done is not None:
+                if done['fingerprint'] != fingerprint:
+                    raise ValueError(f'Input does not match {name} in {output_dir}: the corpus has changed')
+                if dedup is not None:
+                    with open_text(os.path.join(output_dir, name)) as fp:
+                        dedup.add_many(json.loads(line) for line in fp if line.strip())
+                continue
+            if pool is None and workers > 0 and method in ['anaphorate', 'coref', 'synonymize']:
+                from .parallel import open_pool
+                pool = stack.enter_context(open_pool(method, processes=workers, options=kwargs.get('options')))
+            path = os.path.join(output_dir, name)
+            samples = iter_samples(chunk, method, pool=pool, **kwargs)
+            if dedup is not None:
+                samples = dedup.filter(samples)
+            with JsonlWriter(path + '.tmp', compress=compress) as writer:
+                count = writer.write_many(samples)
+            os.replace(path + '.tmp', path)
+            manifest['shards'][name] = {
+                'offset': num * shard_size,
+                'documents': len(chunk),
+                'samples': count,
+                'fingerprint': fingerprint,
+            }
+            save_manifest(output_dir, manifest)
+    return manifest
@@ -0,0 +1,245 @@
+"""Потоковая дедупликация сгенерированных сэмплов
+
+`differently`, `rename_antecedent` и `synonimize_text` дают много одинаковых
+и почти одинаковых сэмплов. `Deduplicator` отбрасывает их на лету:
+
+* точные повторы - по 64-битному хэшу нормализованного текста и разметки (позиций, токенов);
+* почти повторы (опционально) - MinHash по символьным шинглам текста с LSH-корзинами.
+
+Хэши хранятся в компактной таблице numpy (16-32 байта на хэш). Память ограничена `max_items`:
+когда таблица заполняется, начинается новая, а старая удаляется при заполнении следующей,
+поэтому помнятся как минимум последние `max_items` сэмплов.
+
+```
+from rutau.dedup import Deduplicator
+
+dedup = Deduplicator(near_dup=True)
+for sample in dedup.filter(samples):
+    ...
+```
+"""
+import hashlib
+import json
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List
+import numpy as np
+
+
+def normalize(text: str) -> str:
+    """Нормализованный текст: нижний регистр, `ё` -> `е`, пробелы схлопнуты
+    """
+    return ' '.join(text.lower().replace('ё', 'е').split())
+
+
+def sample_text(sample: Dict[str, Any]) -> str:
+    """Текст сэмпла: поле `text` или токены `sequence` (`Coref`)
+    """
+    if 'text' in sample:
+        return sample['text']
+    return ' '.join(sample.get('sequence', []))
+
+
+def hash64(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+def sample_key(sample: Dict[str, Any]) -> int:
+    """64-битный ключ сэмпла: нормализованный текст и разметка (все остальные поля)
+    """
+    markup = {key: value for key, value in sample.items() if key != 'text'}
+    data = normalize(sample_text(sample)) + '\0' + json.dumps(markup, ensure_ascii=False, sort_keys=True)
+    return hash64(data.encode('utf-8'))
+
+
+class HashSet:
+    """Множество 64-битных хэшей с открытой адресацией в массиве numpy
+
+    Заполняется не больше чем наполовину, поэтому пробы короткие.
+    """
+    def __init__(self, capacity: int):
+        size = 1
+        while size < capacity * 2:
+            size *= 2
+        self.table = np.zeros(size, dtype=np.uint64)
+        self.mask = size - 1
+        self.capacity = capacity
+        self.count = 0
+
+    def add(self, key: int) -> bool:
+        """Добавляет хэш
+
+        Returns:
+            bool: True, если хэш уже был
+        """
+        key = key or 1  # 0 - пустая ячейка
+        table = self.table
+        index = key & self.mask
+        while True:
+            value = int(table[index])
+            if value == 0:
+                table[index] = key
+                self.count += 1
+                return False
+            if value == key:
+                return True
+            index = (index + 1) & self.mask
+
+    def __contains__(self, key: int) -> bool:
+        key = key or 1
+        index = key & self.mask
+        while True:
+            value = int(self.table[index])
+            if value == 0:
+                return False
+            if value == key:
+                return True
+            index = (index + 1) & self.mask
+
+    def full(self) -> bool:
+        return self.count >= self.capacity
+
+
+class BoundedHashSet:
+    """Множество хэшей с ограниченной памятью: два поколения `HashSet`
+    """
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+        self.current = HashSet(max_items)
+        self.previous = None
+
+    def __contains__(self, key: int) -> bool:
+        return key in self.current or (self.previous is not None and key in self.previous)
+
+    def add(self, key: int) -> bool:
+        """Добавляет хэш
+
+        Returns:
+            bool: True, если хэш уже был
+        """
+        if self.previous is not None and key in self.previous:
+            seen = True
+            self.current.add(key)
+        else:
+            seen = self.current.add(key)
+        if self.current.full():
+            self.previous, self.current = self.current, HashSet(self.max_items)
+        return seen
+
+
+class MinHash:
+    """MinHash-сигнатуры по символьным шинглам
+
+    Хэши шинглов - crc32, перестановки - `(a * x + b) mod 2^32`.
+    """
+    def __init__(self, num_perm: int = 128, shingle: int = 5, seed: int = 1):
+        """
+        Args:
+            num_perm (int): Длина сигнатуры.
+
+            shingle (int): Длина символьного шингла.
+
+            seed (int): Зерно коэффициентов перестановок.
+        """
+        random = np.random.RandomState(seed)
+        self.a = random.randint(1, 2 ** 32, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = random.randint(0, 2 ** 32, size=num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+        self.shingle = shingle
+
+    def shingles(self, text: str) -> np.ndarray:
+        text = normalize(text)
+        if len(text) <= self.shingle:
+            grams = {text}
+        else:
+            grams = {text[i:i+self.shingle] for i in range(len(text) - self.shingle + 1)}
+        return np.array([zlib.crc32(gram.encode('utf-8')) for gram in grams], dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = self.shingles(text)
+        # (num_perm, shingles); a и x < 2^32, поэтому a * x + b может переполнить uint64,
+        # но переполнение - это вычисление по модулю 2^64, и младшие 32 бита (остаток по модулю 2^32) верны
+        permuted = (np.outer(self.a, hashes) + self.b[:, None]) & np.uint64(0xFFFFFFFF)
+        return permuted.min(axis=1)
+
+
+class Deduplicator:
+    """Фильтр повторов в потоке сэмплов
+    """
+    def __init__(self, near_dup: bool = False, max_items: int = 1000000,
+                 num_perm: int = 128, bands: int = 16, shingle: int = 5, near_dup_items: int = 100000):
+        """
+        Args:
+            near_dup (bool): Отбрасывать и почти повторы (MinHash LSH по тексту).
+
+            max_items (int): Сколько сэмплов помнить как минимум для точных повторов.
+            Память - до 64 байт на сэмпл (32 МБ для значения по умолчанию).
+
+            num_perm (int): Длина MinHash-сигнатуры.
+
+            bands (int): Количество LSH-корзин. Сэмплы считаются почти повторами, если совпала
+            хотя бы одна полоса сигнатуры; порог сходства по Жаккару - примерно
+            `(1 / bands) ** (bands / num_perm)` (0.7 для значений по умолчанию).
+
+            shingle (int): Длина символьного шингла.
+
+            near_dup_items (int): Сколько сэмплов помнить как минимум для почти повторов.
+            Память - до `64 * bands` байт на сэмпл: 100 МБ для значений по умолчанию
+            и около 1 ГБ для миллиона сэмплов.
+        """
+        if num_perm % bands:
+            raise ValueError('num_perm must be divisible by bands')
+        self.near_dup = near_dup
+        self.exact = BoundedHashSet(max_items)
+        self.bands = bands
+        self.rows = num_perm // bands
+        if near_dup:
+            self.minhash = MinHash(num_perm, shingle)
+            self.buckets = BoundedHashSet(near_dup_items * bands)
+        self.samples = 0
+        self.exact_dups = 0
+        self.near_dups = 0
+
+    def band_keys(self, sample: Dict[str, Any]) -> List[int]:
+        signature = self.minhash.signature(sample_text(sample)).astype(np.uint32)
+        return [hash64(band.to_bytes(4, 'little') + signature[band * self.rows:(band + 1) * self.rows].tobytes())
+                for band in range(self.bands)]
+
+    def is_duplicate(self, sample: Dict[str, Any]) -> bool:
+        """Проверяет сэмпл и запоминает его
+
+        Returns:
+            bool: True, если такой (или почти такой) сэмпл уже встречался
+        """
+        self.samples += 1
+        if self.exact.add(sample_key(sample)):
+            self.exact_dups += 1
+            return True
+        if self.near_dup:
+            keys = self.band_keys(sample)
+            seen = any(key in self.buckets for key in keys)
+            for key in keys:
+                self.buckets.add(key)
+            if seen:
+                self.near_dups += 1
+                return True
+        return False
+
+    def add_many(self, samples: Iterable[Dict[str, Any]]) -> None:
+        """Запоминает уже записанные сэмплы (например, при продолжении прерванного запуска)
+        """
+        for sample in samples:
+            self.is_duplicate(sample)
+
+    def filter(self, samples: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Отдаёт только сэмплы, которые ещё не встречались
+        """
+        for sample in samples:
+            if not self.is_duplicate(sample):
+                yield sample
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'samples': self.samples,
+            'exact_duplicates': self.exact_dups,
+            'near_duplicates': self.near_dups,
+        }
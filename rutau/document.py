@@ -0,0 +1,139 @@
+"""Общий размеченный документ
+
+Каждый генератор разбирает текст сам: предложения, токены, морфология и NER
+считаются заново на каждой стадии. `Document` хранит слои разметки одного текста
+и вычисляет каждый слой не больше одного раза, при первом обращении:
+
+* `sents` - предложения razdel (`start`, `stop`, `text`);
+* `tokens` - токены razdel со смещениями в тексте;
+* `morph` - первый разбор pymorphy2 каждого токена;
+* `lemmas` - нормальные формы токенов;
+* `ner` - NER-сущности каждого предложения (начало, конец, тип);
+* `natasha` - документ natasha с морфологией, леммами и сущностями (заполняет `Coref`).
+
+Методы `Anaphorate`, `Coref` и `Synonimizer`, которые принимают текст, принимают и `Document`,
+поэтому цепочка генераторов на одном тексте разбирает его один раз:
+
+```
+from rutau.document import Document
+
+doc = Document(text)
+anaphorate.anaphorate(doc, 'steadily', ['PER'])
+coref.get_anaphoras(doc)
+synonimizer.synonimize_text(doc, ['NOUN', 'ADJF', 'VERB'])
+```
+"""
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Tuple, Union
+from razdel import sentenize, tokenize
+from . import get_model
+from .instrument import stage
+
+if TYPE_CHECKING:
+    from natasha import Doc
+
+
+class Document:
+    """Текст с лениво вычисляемыми слоями разметки
+    """
+    def __init__(self, text: str):
+        """
+        Args:
+            text (str): Текст документа.
+        """
+        self.text = text
+        self.layers: Dict[str, Any] = {}
+
+    def __repr__(self) -> str:
+        return f'Document({self.text[:40]!r}, layers={list(self.layers)})'
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.layers
+
+    def layer(self, name: str, compute: Callable[[], Any]) -> Any:
+        """Слой разметки: вычисляется функцией `compute` при первом обращении
+
+        Args:
+            name (str): Название слоя.
+
+            compute (Callable[[], Any]): Функция, которая вычисляет слой.
+
+        Returns:
+            Any: Значение слоя
+        """
+        if name not in self.layers:
+            self.layers[name] = compute()
+        return self.layers[name]
+
+    @property
+    def sents(self) -> List:
+        """Предложения razdel: `start`, `stop`, `text`"""
+        return self.layer('sents', self._sentenize)
+
+    @property
+    def sent_texts(self) -> List[str]:
+        """Тексты предложений (как `rutau.splitter.get_sents`)"""
+        return [sent.text for sent in self.sents]
+
+    @property
+    def tokens(self) -> List:
+        """Токены razdel: `start`, `stop`, `text`"""
+        return self.layer('tokens', self._tokenize)
+
+    @property
+    def morph(self) -> List:
+        """Первый разбор pymorphy2 каждого токена"""
+        return self.layer('morph', self._parse)
+
+    @property
+    def lemmas(self) -> List[str]:
+        """Нормальные формы токенов"""
+        return self.layer('lemmas', lambda: [parse.normal_form for parse in self.morph])
+
+    @property
+    def ner(self) -> List[List[Tuple[int, int, str]]]:
+        """NER-сущности каждого предложения: начало, конец, тип (смещения - внутри предложения)
+
+        Обычно слой заполняет `Anaphorate` (с кэшем разметки), иначе он считается
+        NER-моделью из общего реестра.
+        """
+        return self.layer('ner', self._tag_ner)
+
+    def _sentenize(self) -> List:
+        with stage('tokenize'):
+            return list(sentenize(self.text))
+
+    def _tokenize(self) -> List:
+        with stage('tokenize'):
+            return list(tokenize(self.text))
+
+    def _parse(self) -> List:
+        tokens = self.tokens
+        morph = get_model('morph')
+        with stage('morph', len(tokens)):
+            return [morph.parse(token.text)[0] for token in tokens]
+
+    def _tag_ner(self) -> List[List[Tuple[int, int, str]]]:
+        sents = self.sent_texts
+        with stage('ner', len(sents)):
+            return [[(span.start, span.stop, span.type) for span in markup.spans]
+                    for markup in get_model('ner').map(sents)]
+
+    def natasha_doc(self) -> 'Doc':
+        """Новый документ natasha, сегментированный по уже найденным предложениям и токенам
+
+        Сегментатор natasha - это тот же razdel, поэтому результат совпадает с `Doc.segment`.
+        """
+        from natasha import Doc
+        from natasha.doc import DocSent, DocToken
+        doc = Doc(self.text)
+        doc.tokens = [DocToken(token.start, token.stop, token.text) for token in self.tokens]
+        # Сегментатор natasha не отдаёт предложений для пустого текста
+        doc.sents = [DocSent(sent.start, sent.stop, sent.text) for sent in self.sents] if self.text else []
+        doc.envelop_sent_tokens()
+        return doc
+
+
+def as_document(text: Union[str, Document]) -> Document:
+    """Документ для текста (или сам документ)
+    """
+    return text if isinstance(text, Document) else Document(text)
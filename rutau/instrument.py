@@ -0,0 +1,232 @@
+"""Инструментирование стадий генераторов: время, количество вызовов, попадания в кэши
+
+По умолчанию выключено: `stage` возвращает общий пустой контекстный менеджер,
+и накладные расходы сводятся к одной проверке. Включается на время `collect()`
+или пока зарегистрирован хотя бы один обработчик (`register_callback`).
+
+```
+from rutau import instrument
+
+with instrument.collect() as stats:
+    anaphorate.anaphorate(text, 'steadily', ['PER'])
+print(stats.as_dict())
+print(stats.to_prometheus())
+```
+
+Стадии: `tokenize`, `ner`, `morph`, `w2v`, `pronoun`, `assemble`. Стадии могут быть вложены:
+`seconds` - полное время стадии, `self_seconds` - без времени вложенных стадий.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List
+
+# Сколько сборщиков и обработчиков сейчас активно: 0 - инструментирование выключено
+_active = 0
+_collectors: List['Stats'] = []
+_callbacks: List[Callable[[str, float, int], None]] = []
+_lock = threading.Lock()
+_local = threading.local()
+
+
+@dataclass
+class StageStats:
+    calls: int = 0
+    items: int = 0
+    seconds: float = 0.0
+    self_seconds: float = 0.0
+
+
+@dataclass
+class Stats:
+    """Статистика, собранная за время `collect()`
+    """
+    stages: Dict[str, StageStats] = field(default_factory=dict)
+    caches: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    seconds: float = 0.0
+
+    def add(self, name: str, seconds: float, self_seconds: float, items: int) -> None:
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = StageStats()
+        stats.calls += 1
+        stats.items += items
+        stats.seconds += seconds
+        stats.self_seconds += self_seconds
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Статистика в виде словаря (например, для JSON)
+
+        Returns:
+            Dict[str, Any]: Общее время, стадии и кэши с долей попаданий
+        """
+        caches = {}
+        for name, info in self.caches.items():
+            total = info['hits'] + info['misses']
+            caches[name] = dict(info, hit_rate=info['hits'] / total if total else None)
+        return {
+            'seconds': self.seconds,
+            'stages': {name: vars(stats).copy() for name, stats in self.stages.items()},
+            'caches': caches,
+        }
+
+    def to_prometheus(self, prefix: str = 'rutau') -> str:
+        """Статистика в текстовом формате Prometheus
+
+        Args:
+            prefix (str): Префикс имён метрик.
+
+        Returns:
+            str: Текст метрик
+        """
+        lines = []
+        metrics = [
+            ('stage_calls_total', 'counter', 'Stage calls', 'calls'),
+            ('stage_items_total', 'counter', 'Items processed by stage', 'items'),
+            ('stage_seconds_total', 'counter', 'Wall time of stage including nested stages', 'seconds'),
+            ('stage_self_seconds_total', 'counter', 'Wall time of stage excluding nested stages', 'self_seconds'),
+        ]
+        for metric, kind, help, attr in metrics:
+            lines.append(f'# HELP {prefix}_{metric} {help}')
+            lines.append(f'# TYPE {prefix}_{metric} {kind}')
+            for name, stats in sorted(self.stages.items()):
+                lines.append(f'{prefix}_{metric}{{stage="{name}"}} {getattr(stats, attr)}')
+        for metric, kind, help in [('cache_hits_total', 'counter', 'Cache hits'),
+                                   ('cache_misses_total', 'counter', 'Cache misses'),
+                                   ('cache_size', 'gauge', 'Cache entries')]:
+            lines.append(f'# HELP {prefix}_{metric} {help}')
+            lines.append(f'# TYPE {prefix}_{metric} {kind}')
+            key = metric.split('_')[1]
+            for name, info in sorted(self.caches.items()):
+                lines.append(f'{prefix}_{metric}{{cache="{name}"}} {info[key]}')
+        return '\n'.join(lines) + '\n'
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ('name', 'items', 'start', 'children')
+
+    def __init__(self, name: str, items: int):
+        self.name = name
+        self.items = items
+        self.children = 0.0
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        stack = _local.stack
+        stack.pop()
+        if stack:
+            stack[-1].children += seconds
+        _record(self.name, seconds, seconds - self.children, self.items)
+        return False
+
+
+def _record(name: str, seconds: float, self_seconds: float, items: int) -> None:
+    with _lock:
+        for stats in _collectors:
+            stats.add(name, seconds, self_seconds, items)
+        callbacks = list(_callbacks)
+    for callback in callbacks:
+        callback(name, seconds, items)
+
+
+def enabled() -> bool:
+    """Включено ли инструментирование
+    """
+    return _active > 0
+
+
+def stage(name: str, items: int = 1):
+    """Контекстный менеджер, замеряющий стадию
+
+    Args:
+        name (str): Имя стадии.
+
+        items (int): Сколько элементов (текстов, предложений, слов) обработано за вызов.
+    """
+    if not _active:
+        return _NULL_STAGE
+    return _Stage(name, items)
+
+
+def register_callback(callback: Callable[[str, float, int], None]) -> None:
+    """Регистрирует обработчик, вызываемый после каждой стадии
+
+    Args:
+        callback (Callable[[str, float, int], None]): Функция от имени стадии, времени в секундах
+        и количества элементов.
+    """
+    global _active
+    with _lock:
+        _callbacks.append(callback)
+        _active += 1
+
+
+def unregister_callback(callback: Callable[[str, float, int], None]) -> None:
+    global _active
+    with _lock:
+        _callbacks.remove(callback)
+        _active -= 1
+
+
+def cache_info() -> Dict[str, Dict[str, int]]:
+    """Статистика кэшей загруженных моделей (например, `morph.parse`)
+    """
+    from . import _models
+    info = {}
+    for (name, _), model in list(_models.items()):
+        if hasattr(type(model), 'cache_info'):
+            for cache, stats in model.cache_info().items():
+                info[f'{name}.{cache}'] = dict(stats)
+    return info
+
+
+@contextmanager
+def collect() -> Iterator[Stats]:
+    """Включает инструментирование и собирает статистику стадий и кэшей
+
+    Yields:
+        Stats: Статистика, заполняемая по ходу работы; кэши - приращение за время сбора
+    """
+    global _active
+    stats = Stats()
+    caches_before = cache_info()
+    with _lock:
+        _collectors.append(stats)
+        _active += 1
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats.seconds = time.perf_counter() - start
+        with _lock:
+            _collectors.remove(stats)
+            _active -= 1
+        for name, info in cache_info().items():
+            before = caches_before.get(name, {})
+            stats.caches[name] = {
+                'hits': info['hits'] - before.get('hits', 0),
+                'misses': info['misses'] - before.get('misses', 0),
+                'size': info['size'],
+            }
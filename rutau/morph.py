@@ -0,0 +1,74 @@
+"""Морфологический анализатор с ограниченным кэшем
+
+Одни и те же токены разбираются всеми генераторами по несколько раз, а лексика
+новостей распределена по Ципфу, поэтому небольшой LRU-кэш снимает почти всю
+работу pymorphy2.
+"""
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+
+
+class CachedMorphAnalyzer:
+    """Обёртка над `pymorphy2.MorphAnalyzer` с LRU-кэшем разборов и словоформ
+
+    Остальные методы `MorphAnalyzer` доступны без кэширования.
+    """
+    def __init__(self, morph, maxsize: int = 100000):
+        """
+        Args:
+            morph (pymorphy2.MorphAnalyzer): Анализатор, результаты которого кэшируются.
+
+            maxsize (int): Максимальное количество записей в каждом кэше.
+        """
+        self.morph = morph
+        self.maxsize = maxsize
+        self._parse = lru_cache(maxsize=maxsize)(self._parse_uncached)
+        self._inflect = lru_cache(maxsize=maxsize)(self._inflect_uncached)
+
+    def _parse_uncached(self, word: str) -> Tuple:
+        return tuple(self.morph.parse(word))
+
+    def _inflect_uncached(self, word: str, tagset: FrozenSet[str]) -> Optional[str]:
+        inflected = self.parse(word)[0].inflect(set(tagset))
+        return inflected.word if inflected is not None else None
+
+    def parse(self, word: str) -> Tuple:
+        """Разборы слова, как `MorphAnalyzer.parse` (но кортежем: результат общий для всех вызовов)
+        """
+        return self._parse(word)
+
+    def inflect(self, word: str, tagset: FrozenSet[str]) -> Optional[str]:
+        """Ставит первый разбор слова в форму с граммемами `tagset`
+
+        Args:
+            word (str): Слово.
+
+            tagset (FrozenSet[str]): Граммемы нужной формы.
+
+        Returns:
+            Optional[str]: Словоформа или None, если такой формы нет
+        """
+        return self._inflect(word, frozenset(tagset))
+
+    def cache_info(self) -> Dict[str, Dict[str, int]]:
+        """Статистика кэшей: попадания, промахи, размер
+        """
+        info = {}
+        for name, cached in [('parse', self._parse), ('inflect', self._inflect)]:
+            stats = cached.cache_info()
+            info[name] = {
+                'hits': stats.hits,
+                'misses': stats.misses,
+                'size': stats.currsize,
+                'maxsize': stats.maxsize,
+            }
+        return info
+
+    def cache_clear(self) -> None:
+        self._parse.cache_clear()
+        self._inflect.cache_clear()
+
+    def __getattr__(self, name: str) -> Any:
+        if name == 'morph':
+            raise AttributeError(name)
+        return getattr(self.morph, name)
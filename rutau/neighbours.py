@@ -0,0 +1,129 @@
+"""Таблица заранее посчитанных ближайших соседей для словаря word2vec
+
+Соседи каждого ключа `лемма_ЧАСТЬРЕЧИ` считаются один раз и сохраняются в папку:
+
+* `vocab.txt` - ключи словаря, по одному на строку;
+* `ids.npy` - матрица номеров соседей (int32);
+* `scores.npy` - матрица близостей (float16).
+
+При загрузке матрицы открываются через memory-mapping, поэтому поиск "синонимов"
+сводится к чтению одной строки, а векторы word2vec не нужны вовсе.
+"""
+import os
+from typing import List, Optional, Tuple
+import numpy as np
+
+
+def most_similar_rows(vectors: np.ndarray, indexes: np.ndarray, topn: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Ближайшие соседи для нескольких строк нормированной матрицы векторов
+
+    Args:
+        vectors (np.ndarray): Нормированная матрица векторов словаря
+        (или `rutau.compact.CompactMatrix`: тогда близости считаются по сжатой матрице блоками).
+
+        indexes (np.ndarray): Номера строк, для которых ищутся соседи.
+
+        topn (int): Количество соседей.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Номера соседей по убыванию близости (без самой строки) и их близости.
+    """
+    if isinstance(vectors, np.ndarray):
+        sims = np.dot(vectors[indexes], vectors.T)
+    else:
+        sims = vectors.similarities(indexes)
+    sims[np.arange(len(indexes)), indexes] = -np.inf
+    topn = min(topn, sims.shape[1] - 1)
+    if topn < 1:
+        return np.zeros((len(indexes), 0), dtype=np.int64), np.zeros((len(indexes), 0), dtype=sims.dtype)
+    top = np.argpartition(-sims, topn - 1, axis=1)[:, :topn]
+    top_sims = np.take_along_axis(sims, top, axis=1)
+    order = np.argsort(-top_sims, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_sims, order, axis=1)
+
+
+class NeighbourTable:
+    """Ближайшие соседи ключей словаря word2vec
+    """
+    def __init__(self, index2word: List[str], ids: np.ndarray, scores: np.ndarray):
+        self.index2word = index2word
+        self.vocab = {word: i for i, word in enumerate(index2word)}
+        self.ids = ids
+        self.scores = scores
+
+    def most_similar(self, key: str, topn: int = 10) -> List[Tuple[str, float]]:
+        """Соседи ключа по убыванию близости
+
+        Args:
+            key (str): Ключ словаря, например `мама_NOUN`.
+
+            topn (int): Количество соседей (не больше, чем посчитано в таблице).
+
+        Returns:
+            List[Tuple[str, float]]: Пары (ключ соседа, близость).
+        """
+        row = self.vocab[key]
+        return [(self.index2word[i], float(score))
+                for i, score in zip(self.ids[row, :topn].tolist(), self.scores[row, :topn].tolist())]
+
+    def save(self, path: str) -> None:
+        """Сохраняет таблицу в папку `path`
+        """
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, 'vocab.txt'), 'w', encoding='utf-8') as fp:
+            fp.write('\n'.join(self.index2word))
+        np.save(os.path.join(path, 'ids.npy'), self.ids)
+        np.save(os.path.join(path, 'scores.npy'), self.scores)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'NeighbourTable':
+        """Загружает таблицу из папки `path`
+
+        Args:
+            path (str): Папка с таблицей.
+
+            mmap (bool): Открыть матрицы через memory-mapping только для чтения.
+
+        Returns:
+            NeighbourTable: Таблица соседей
+        """
+        with open(os.path.join(path, 'vocab.txt'), encoding='utf-8') as fp:
+            index2word = fp.read().split('\n')
+        mmap_mode = 'r' if mmap else None
+        ids = np.load(os.path.join(path, 'ids.npy'), mmap_mode=mmap_mode)
+        scores = np.load(os.path.join(path, 'scores.npy'), mmap_mode=mmap_mode)
+        return cls(index2word, ids, scores)
+
+
+def build_neighbour_table(w2v_model, topn: int = 10, max_rank: Optional[int] = None,
+                          pos: Optional[List[str]] = None, batch_size: int = 256) -> NeighbourTable:
+    """Считает таблицу соседей по модели word2vec
+
+    Args:
+        w2v_model (KeyedVectors): Модель word2vec с нормированными векторами.
+
+        topn (int): Сколько соседей хранить для каждого ключа.
+
+        max_rank (Optional[int]): Брать только столько самых частотных слов словаря.
+
+        pos (Optional[List[str]]): Брать только ключи с этими частями речи, например `['NOUN', 'VERB']`.
+
+        batch_size (int): Сколько ключей обрабатывать одним матричным умножением.
+
+    Returns:
+        NeighbourTable: Таблица соседей
+    """
+    # Словарь gensim отсортирован по убыванию частоты
+    index2word = w2v_model.index2word[:max_rank]
+    rows = [i for i, word in enumerate(index2word)
+            if pos is None or word.rsplit('_', 1)[-1] in pos]
+    vectors = w2v_model.vectors_norm
+    if len(rows) < len(w2v_model.index2word):
+        vectors = vectors[rows]
+    topn = min(topn, len(rows) - 1)
+    ids = np.zeros((len(rows), topn), dtype=np.int32)
+    scores = np.zeros((len(rows), topn), dtype=np.float16)
+    for start in range(0, len(rows), batch_size):
+        indexes = np.arange(start, min(start + batch_size, len(rows)))
+        ids[indexes], scores[indexes] = most_similar_rows(vectors, indexes, topn)
+    return NeighbourTable([index2word[i] for i in rows], ids, scores)
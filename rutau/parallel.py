@@ -0,0 +1,198 @@
+"""Параллельная генерация корпуса на пуле процессов
+
+Модели загружаются один раз: при старте через `fork` - в родительском процессе
+(рабочие процессы наследуют их страницы copy-on-write), иначе - один раз
+в каждом рабочем процессе через initializer.
+
+Пример:
+
+```
+from rutau.parallel import generate
+
+for corpus in generate(texts, 'anaphorate', processes=32,
+                       sent_splitting='steadily', anaph_type=['PER']):
+    ...
+```
+"""
+import gc
+import json
+import os
+import multiprocessing
+import multiprocessing.pool
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from . import preload, chunked
+
+# Какие модели нужны каждому генератору с параметрами по умолчанию (см. `required_models`)
+MODELS = {
+    'anaphorate': ['ner', 'morph'],
+    'coref': ['natasha', 'morph'],
+    'synonymize': ['w2v', 'morph'],
+}
+
+# Генераторы текущего процесса: (генератор, параметры конструктора) -> экземпляр
+_generators: Dict[Tuple[str, str], Any] = {}
+
+
+def required_models(method: str, options: Optional[Dict[str, Any]] = None) -> List[str]:
+    """Модели, которые нужны генератору с параметрами конструктора `options`
+
+    Для `synonymize` это таблица соседей (`use_neighbours`) или векторы нужной точности (`vectors`).
+    """
+    if method not in MODELS:
+        raise ValueError(f'Unknown method: {method}')
+    options = options or {}
+    if method == 'synonymize':
+        if options.get('use_neighbours'):
+            return ['neighbours', 'morph']
+        vectors = options.get('vectors', 'float32')
+        return ['w2v' if vectors == 'float32' else f'w2v_{vectors}', 'morph']
+    return MODELS[method]
+
+
+def get_generator(method: str, options: Optional[Dict[str, Any]] = None) -> Any:
+    """Возвращает экземпляр генератора для текущего процесса
+
+    Args:
+        method (str): `anaphorate`, `coref` или `synonymize`.
+
+        options (Optional[Dict[str, Any]]): Параметры конструктора генератора,
+        например `{'use_neighbours': True}` или `{'vectors': 'int8'}` для `synonymize`.
+
+    Для `anaphorate` и `coref` подключается кэш разметки из переменных окружения
+    (см. `rutau.annotation_cache.from_environ`).
+    """
+    options = options or {}
+    key = (method, json.dumps(options, sort_keys=True))
+    if key not in _generators:
+        from .annotation_cache import from_environ
+        if method == 'anaphorate':
+            from .anaphorate import Anaphorate
+            _generators[key] = Anaphorate(cache=from_environ(), **options)
+        elif method == 'coref':
+            from .coref import Coref
+            _generators[key] = Coref(cache=from_environ(), **options)
+        elif method == 'synonymize':
+            from .synonimizers import Synonimizer
+            _generators[key] = Synonimizer(**options)
+        else:
+            raise ValueError(f'Unknown method: {method}')
+    return _generators[key]
+
+
+def run_chunk(method: str, texts: List[str], kwargs: Dict[str, Any],
+              options: Optional[Dict[str, Any]] = None) -> List:
+    """Обрабатывает пачку текстов выбранным генератором
+
+    Returns:
+        List: Результат для каждого текста пачки
+    """
+    generator = get_generator(method, options)
+    if method == 'anaphorate':
+        return list(generator.anaphorate_many(texts, **kwargs))
+    if method == 'coref':
+        return list(generator.get_anaphoras_many(texts, **kwargs))
+    return generator.synonimize_texts(texts, **kwargs)
+
+
+def _init_worker(method: str, options: Optional[Dict[str, Any]] = None) -> None:
+    # При fork модели и генератор уже унаследованы от родителя
+    preload(*required_models(method, options))
+    get_generator(method, options)
+
+
+@contextmanager
+def open_pool(method: str, processes: Optional[int] = None, start_method: Optional[str] = None,
+              maxtasksperchild: Optional[int] = None,
+              options: Optional[Dict[str, Any]] = None) -> Iterator[multiprocessing.pool.Pool]:
+    """Пул рабочих процессов для генератора `method`
+
+    Один пул можно передать в несколько вызовов `generate` (например, по шардам
+    `rutau.corpus.run_sharded`), и модели загружаются в рабочие процессы один раз.
+    При `fork` модели загружаются в родителе, и на время жизни пула объекты родителя
+    убираются из-под сборщика мусора (`gc.freeze`), чтобы рабочие процессы не копировали
+    страницы с ними; после закрытия пула они возвращаются сборщику (`gc.unfreeze`).
+
+    Args:
+        method (str): `anaphorate`, `coref` или `synonymize`.
+
+        processes (Optional[int]): Количество рабочих процессов. По умолчанию - по числу ядер.
+
+        start_method (Optional[str]): Способ запуска процессов: `fork`, `spawn`, `forkserver`.
+
+        maxtasksperchild (Optional[int]): Через сколько пачек перезапускать рабочий процесс.
+
+        options (Optional[Dict[str, Any]]): Параметры конструктора генератора (см. `get_generator`).
+    """
+    models = required_models(method, options)
+    ctx = multiprocessing.get_context(start_method)
+    frozen = False
+    if ctx.get_start_method() == 'fork':
+        preload(*models)
+        get_generator(method, options)
+        gc.freeze()
+        frozen = True
+    try:
+        with ctx.Pool(processes or os.cpu_count(), initializer=_init_worker, initargs=(method, options),
+                      maxtasksperchild=maxtasksperchild) as pool:
+            yield pool
+    finally:
+        if frozen:
+            gc.unfreeze()
+
+
+def generate(texts: Iterable[str], method: str, processes: Optional[int] = None, chunk_size: int = 16,
+             max_pending: Optional[int] = None, start_method: Optional[str] = None,
+             maxtasksperchild: Optional[int] = None, pool: Optional[multiprocessing.pool.Pool] = None,
+             options: Optional[Dict[str, Any]] = None, **kwargs) -> Iterator:
+    """Параллельно применяет генератор к потоку текстов
+
+    Тексты уходят в рабочие процессы пачками по `chunk_size`, одновременно в работе
+    не больше `max_pending` пачек, поэтому входной поток читается по мере обработки.
+
+    Args:
+        texts (Iterable[str]): Входные тексты.
+
+        method (str): Генератор:
+            * `anaphorate` - `Anaphorate.anaphorate`
+            * `coref` - `Coref.get_anaphoras`
+            * `synonymize` - `Synonimizer.synonimize_text`
+
+        processes (Optional[int]): Количество рабочих процессов. По умолчанию - по числу ядер.
+
+        chunk_size (int): Сколько текстов отправлять в процесс за раз.
+
+        max_pending (Optional[int]): Сколько пачек может быть в работе одновременно.
+        По умолчанию - вдвое больше числа процессов.
+
+        start_method (Optional[str]): Способ запуска процессов: `fork`, `spawn`, `forkserver`.
+
+        maxtasksperchild (Optional[int]): Через сколько пачек перезапускать рабочий процесс.
+
+        pool (Optional[multiprocessing.pool.Pool]): Уже открытый пул этого генератора (см. `open_pool`).
+        По умолчанию пул создаётся на время вызова.
+
+        options (Optional[Dict[str, Any]]): Параметры конструктора генератора (см. `get_generator`);
+        открытый пул должен быть создан с теми же.
+
+        kwargs: Параметры генератора, например `sent_splitting`, `anaph_type`, `shift`, `type`.
+
+    Yields:
+        Результат генератора для каждого входного текста, в порядке входа.
+    """
+    if method not in MODELS:
+        raise ValueError(f'Unknown method: {method}')
+    if pool is None:
+        with open_pool(method, processes, start_method, maxtasksperchild, options) as pool:
+            yield from generate(texts, method, processes=processes, chunk_size=chunk_size,
+                                max_pending=max_pending, pool=pool, options=options, **kwargs)
+        return
+    max_pending = max_pending or (processes or os.cpu_count()) * 2
+    pending = deque()
+    for chunk in chunked(texts, chunk_size):
+        pending.append(pool.apply_async(run_chunk, (method, chunk, kwargs, options)))
+        if len(pending) >= max_pending:
+            yield from pending.popleft().get()
+    while pending:
+        yield from pending.popleft().get()
@@ -0,0 +1,105 @@
+"""Таблица форм личных местоимений 3-го лица
+
+Вместо разбора и склонения `он`/`она`/`оно`/`они` через pymorphy2 для каждого
+упоминания формы берутся из заранее построенной таблицы.
+
+https://pymorphy2.readthedocs.io/en/latest/user/grammemes.html#grammeme-docs
+"""
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional, Tuple
+
+# (род, число) -> падеж -> (форма, форма после предлога: `Af-p`)
+_FORMS = {
+    ('masc', 'sing'): {
+        'nomn': ('он', 'он'), 'gent': ('его', 'него'), 'datv': ('ему', 'нему'),
+        'accs': ('его', 'него'), 'ablt': ('им', 'ним'), 'loct': ('нём', 'нём'),
+    },
+    ('femn', 'sing'): {
+        'nomn': ('она', 'она'), 'gent': ('её', 'неё'), 'datv': ('ей', 'ней'),
+        'accs': ('её', 'неё'), 'ablt': ('ей', 'ней'), 'loct': ('ней', 'ней'),
+    },
+    ('neut', 'sing'): {
+        'nomn': ('оно', 'оно'), 'gent': ('его', 'него'), 'datv': ('ему', 'нему'),
+        'accs': ('его', 'него'), 'ablt': ('им', 'ним'), 'loct': ('нём', 'нём'),
+    },
+    ('plur', 'plur'): {
+        'nomn': ('они', 'они'), 'gent': ('их', 'них'), 'datv': ('им', 'ним'),
+        'accs': ('их', 'них'), 'ablt': ('ими', 'ними'), 'loct': ('них', 'них'),
+    },
+}
+
+# Дополнительные падежи pymorphy2 сводим к основным
+_CASES = {
+    'nomn': 'nomn', 'gent': 'gent', 'datv': 'datv', 'accs': 'accs', 'ablt': 'ablt', 'loct': 'loct',
+    'voct': 'nomn', 'gen2': 'gent', 'acc2': 'accs', 'loc2': 'loct',
+}
+
+# Падежи Universal Dependencies (natasha) -> падежи pymorphy2
+UD_CASES = {
+    'Nom': 'nomn', 'Gen': 'gent', 'Par': 'gent', 'Dat': 'datv',
+    'Acc': 'accs', 'Ins': 'ablt', 'Loc': 'loct', 'Voc': 'nomn',
+}
+
+UD_GENDERS = {'Masc': 'masc', 'Fem': 'femn', 'Neut': 'neut'}
+
+
+def _build_table() -> Mapping[Tuple[str, str, str, bool], str]:
+    table: Dict[Tuple[str, str, str, bool], str] = {}
+    for gender in ['masc', 'femn', 'neut']:
+        for number in ['sing', 'plur']:
+            forms = _FORMS[(gender, 'sing')] if number == 'sing' else _FORMS[('plur', 'plur')]
+            for case, target in _CASES.items():
+                table[(gender, number, case, False)] = forms[target][0]
+                table[(gender, number, case, True)] = forms[target][1]
+    return MappingProxyType(table)
+
+
+# (род, число, падеж, Af-p) -> местоимение
+PRONOUNS = _build_table()
+
+
+def inflect_pronoun(gender: Optional[str], number: Optional[str] = 'sing',
+                    case: Optional[str] = 'nomn', af_p: bool = False) -> str:
+    """Местоимение 3-го лица в нужной форме
+
+    Args:
+        gender (Optional[str]): Род в обозначениях pymorphy2: `masc`, `femn`, `neut`. По умолчанию - `masc`.
+
+        number (Optional[str]): Число: `sing`, `plur`. По умолчанию - `sing`.
+
+        case (Optional[str]): Падеж в обозначениях pymorphy2. По умолчанию - `nomn`.
+
+        af_p (bool): Форма после предлога (`него`, `ней`, `них`).
+
+    Returns:
+        str: Местоимение
+    """
+    key = (gender or 'masc', number or 'sing', case or 'nomn', af_p)
+    pronoun = PRONOUNS.get(key)
+    if pronoun is None:
+        # Неизвестные граммемы: оставляем известные части ключа
+        pronoun = PRONOUNS[(
+            gender if gender in UD_GENDERS.values() else 'masc',
+            'plur' if number == 'plur' else 'sing',
+            _CASES.get(case, 'nomn'),
+            af_p)]
+    return pronoun
+
+
+def pronoun_from_feats(feats: Optional[Dict[str, str]]) -> str:
+    """Местоимение 3-го лица по морфологическим признакам Universal Dependencies
+
+    Args:
+        feats (Optional[Dict[str, str]]): Признаки токена natasha, например `{'Case': 'Gen', 'Gender': 'Fem'}`.
+
+    Returns:
+        str: Местоимение
+    """
+    feats = feats or {}
+    if feats.get('Number') == 'Plur':
+        gender, number = 'masc', 'plur'
+    elif 'Gender' in feats:
+        gender, number = UD_GENDERS.get(feats['Gender'], 'neut'), 'sing'
+    else:
+        gender, number = 'masc', 'sing'
+    return PRONOUNS[(gender, number, UD_CASES.get(feats.get('Case'), 'nomn'), False)]
@@ -0,0 +1,409 @@
+"""Локальный HTTP-сервис генерации с динамическим микробатчингом
+
+Модели загружаются один раз при старте. Одновременные запросы к одному генератору
+собираются в пачку: пачка уходит в модель, как только набралось `max_batch_size` текстов
+или истёк бюджет задержки `max_latency` с момента первого запроса в пачке.
+Генераторы работают в пуле потоков, цикл событий остаётся свободным.
+
+```
+python -m rutau serve --port 8765 --max-batch-size 32 --max-latency-ms 10
+
+curl -s localhost:8765/anaphorate -d '{"text": "...", "sent_splitting": "steadily", "anaph_type": ["PER"]}'
+curl -s localhost:8765/coref -d '{"texts": ["...", "..."], "shift": true}'
+curl -s localhost:8765/synonymize -d '{"text": "...", "type": ["NOUN"]}'
+curl -s localhost:8765/stats
+```
+
+В теле запроса - `text` (ответ `{"result": ...}`) или `texts` (ответ `{"results": [...]}`)
+и параметры генератора. Сервис слушает только локальный адрес и не обращается к внешним сервисам.
+"""
+import asyncio
+import ipaddress
+import json
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from . import preload
+from .parallel import get_generator, required_models
+
+# Параметры каждого генератора и их значения по умолчанию
+PARAMS: Dict[str, Dict[str, Any]] = {
+    'anaphorate': {'sent_splitting': 'steadily', 'anaph_type': ['PER'], 'max_distance': None},
+    'coref': {'shift': True},
+    'synonymize': {'type': ['NOUN', 'ADJF', 'VERB']},
+}
+
+# Допустимые значения списочных параметров
+CHOICES: Dict[str, List[str]] = {
+    'anaph_type': ['PER', 'LOC', 'ORG'],
+    'type': ['NOUN', 'ADJF', 'VERB'],
+}
+
+STATUS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+          413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+def run_batch(method: str, texts: List[str], params: Dict[str, Any],
+              options: Optional[Dict[str, Any]] = None) -> List:
+    """Применяет генератор к пачке текстов (в потоке пула)
+
+    Args:
+        options (Optional[Dict[str, Any]]): Параметры конструктора генератора (см. `rutau.parallel.get_generator`).
+
+    Returns:
+        List: Результат для каждого текста пачки
+    """
+    generator = get_generator(method, options)
+    if method == 'anaphorate':
+        return list(generator.anaphorate_many(texts, batch_size=len(texts), **params))
+    if method == 'coref':
+        return list(generator.get_anaphoras_many(texts, batch_size=len(texts), **params))
+    return generator.synonimize_texts(texts, **params)
+
+
+class MicroBatcher:
+    """Очередь запросов одного генератора, собирающая их в пачки
+    """
+    def __init__(self, method: str, executor: ThreadPoolExecutor, max_batch_size: int = 32,
+                 max_latency: float = 0.01, options: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            method (str): Генератор: `anaphorate`, `coref`, `synonymize`.
+
+            executor (ThreadPoolExecutor): Пул, в котором работают модели.
+
+            max_batch_size (int): Максимальное количество текстов в пачке.
+
+            max_latency (float): Сколько секунд ждать добора пачки после первого запроса.
+
+            options (Optional[Dict[str, Any]]): Параметры конструктора генератора.
+        """
+        self.method = method
+        self.options = options
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.queue: 'asyncio.Queue[Tuple[str, Dict[str, Any], asyncio.Future]]' = asyncio.Queue()
+        self.requests = 0
+        self.texts = 0
+        self.batches = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.started = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def submit(self, texts: List[str], params: Dict[str, Any]) -> List:
+        """Ставит тексты в очередь и ждёт результатов
+
+        Returns:
+            List: Результат для каждого текста
+        """
+        loop = asyncio.get_event_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self.queue.put_nowait((text, params, future))
+            futures.append(future)
+        self.requests += 1
+        return list(await asyncio.gather(*futures))
+
+    async def _next_batch(self) -> List[Tuple[str, Dict[str, Any], asyncio.Future]]:
+        loop = asyncio.get_event_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_latency
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = await self._next_batch()
+            # В одну пачку модели попадают только запросы с одинаковыми параметрами
+            groups: Dict[str, List[Tuple[str, Dict[str, Any], asyncio.Future]]] = {}
+            for item in batch:
+                groups.setdefault(json.dumps(item[1], sort_keys=True), []).append(item)
+            for items in groups.values():
+                texts = [text for text, _, _ in items]
+                start = time.monotonic()
+                try:
+                    results = await loop.run_in_executor(
+                        self.executor, run_batch, self.method, texts, items[0][1], self.options)
+                except Exception as e:
+                    self.errors += 1
+                    for _, _, future in items:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                finally:
+                    self.busy_seconds += time.monotonic() - start
+                self.batches += 1
+                self.texts += len(texts)
+                for (_, _, future), result in zip(items, results):
+                    if not future.done():
+                        future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        """Пропускная способность и глубина очереди
+        """
+        uptime = time.monotonic() - self.started
+        return {
+            'requests': self.requests,
+            'texts': self.texts,
+            'batches': self.batches,
+            'errors': self.errors,
+            'queue_depth': self.queue.qsize(),
+            'mean_batch_size': self.texts / self.batches if self.batches else None,
+            'busy_seconds': self.busy_seconds,
+            'texts_per_s': self.texts / uptime if uptime else None,
+            'texts_per_busy_s': self.texts / self.busy_seconds if self.busy_seconds else None,
+        }
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class Server:
+    """HTTP-сервер генераторов поверх `asyncio.start_server`
+
+    Поддерживается ровно то, что нужно клиентам: `POST /<генератор>` с JSON в теле,
+    `GET /stats`, keep-alive и `Content-Length`.
+    """
+    def __init__(self, methods: Optional[List[str]] = None, max_batch_size: int = 32,
+                 max_latency: float = 0.01, threads: int = 1, max_body: int = 16 * 1024 * 1024,
+                 options: Optional[Dict[str, Dict[str, Any]]] = None):
+        """
+        Args:
+            methods (Optional[List[str]]): Какие генераторы обслуживать. По умолчанию - все.
+
+            max_batch_size (int): Максимальное количество текстов в пачке.
+
+            max_latency (float): Бюджет задержки на сбор пачки, секунды.
+
+            threads (int): Количество потоков для моделей.
+
+            max_body (int): Максимальный размер тела запроса, байты.
+
+            options (Optional[Dict[str, Dict[str, Any]]]): Параметры конструкторов генераторов,
+            например `{'synonymize': {'vectors': 'int8'}}` (см. `rutau.parallel.get_generator`).
+        """
+        self.methods = methods or list(PARAMS)
+        self.options = options or {}
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.max_body = max_body
+        self.executor = ThreadPoolExecutor(threads)
+        self.batchers: Dict[str, MicroBatcher] = {}
+        self.started = time.monotonic()
+
+    def load(self) -> None:
+        """Загружает модели и генераторы до приёма запросов
+        """
+        for method in self.methods:
+            preload(*required_models(method, self.options.get(method)))
+            get_generator(method, self.options.get(method))
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8765) -> asyncio.AbstractServer:
+        for method in self.methods:
+            batcher = MicroBatcher(method, self.executor, self.max_batch_size, self.max_latency,
+                                   self.options.get(method))
+            batcher.start()
+            self.batchers[method] = batcher
+        return await asyncio.start_server(self.handle, host, port)
+
+    async def stop(self) -> None:
+        for batcher in self.batchers.values():
+            await batcher.stop()
+        self.executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'uptime': time.monotonic() - self.started,
+            'max_batch_size': self.max_batch_size,
+            'max_latency': self.max_latency,
+            'methods': {method: batcher.stats() for method, batcher in self.batchers.items()},
+        }
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                try:
+                    status, payload = 200, await self.dispatch(method, path, body)
+                except HttpError as e:
+                    status, payload = e.status, {'error': str(e)}
+                except Exception as e:
+                    status, payload = 500, {'error': f'{type(e).__name__}: {e}'}
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                self.write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except HttpError as e:
+            self.write_response(writer, e.status, {'error': str(e)}, False)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        """Читает один запрос: метод, путь, заголовки, тело. None - клиент закрыл соединение
+        """
+        line = await reader.readline()
+        if not line:
+            return None
+        parts = line.decode('latin-1').split()
+        if len(parts) != 3:
+            raise HttpError(400, 'Malformed request line')
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise HttpError(400, 'Content-Length must be a number')
+        if length < 0:
+            raise HttpError(400, 'Content-Length must not be negative')
+        if length > self.max_body:
+            raise HttpError(413, 'Request body is too large')
+        body = await reader.readexactly(length) if length else b''
+        return parts[0].upper(), parts[1].split('?')[0], headers, body
+
+    async def dispatch(self, method: str, path: str, body: bytes) -> Any:
+        name = path.strip('/')
+        if name == 'stats':
+            if method != 'GET':
+                raise HttpError(405, 'Use GET /stats')
+            return self.stats()
+        if name not in self.batchers:
+            raise HttpError(404, f'Unknown endpoint: {path}')
+        if method != 'POST':
+            raise HttpError(405, f'Use POST /{name}')
+        try:
+            request = json.loads(body or b'{}')
+        except ValueError:
+            raise HttpError(400, 'Body must be JSON')
+        if not isinstance(request, dict):
+            raise HttpError(400, 'Body must be a JSON object')
+        params = self.params(name, request)
+        if 'texts' in request:
+            texts = request['texts']
+            if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                raise HttpError(400, '`texts` must be a list of strings')
+            return {'results': await self.batchers[name].submit(texts, params)}
+        if not isinstance(request.get('text'), str):
+            raise HttpError(400, 'Either `text` or `texts` is required')
+        return {'result': (await self.batchers[name].submit([request['text']], params))[0]}
+
+    def params(self, name: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Параметры генератора из запроса, с проверкой
+        """
+        unknown = set(request) - set(PARAMS[name]) - {'text', 'texts'}
+        if unknown:
+            raise HttpError(400, f'Unknown parameters: {", ".join(sorted(unknown))}')
+        params = {key: request.get(key, default) for key, default in PARAMS[name].items()}
+        if name == 'anaphorate' and params['sent_splitting'] not in ['steadily', 'differently']:
+            raise HttpError(400, 'sent_splitting must be steadily or differently')
+        for key, choices in CHOICES.items():
+            # Строка вместо списка сравнивалась бы с типами как подстрока
+            if key in params and (not isinstance(params[key], list)
+                                  or not all(isinstance(value, str) and value in choices for value in params[key])):
+                raise HttpError(400, f'{key} must be a list of {", ".join(choices)}')
+        if 'shift' in params and not isinstance(params['shift'], bool):
+            raise HttpError(400, 'shift must be a boolean')
+        max_distance = params.get('max_distance')
+        if max_distance is not None and (isinstance(max_distance, bool) or not isinstance(max_distance, int)
+                                         or max_distance < 1):
+            raise HttpError(400, 'max_distance must be a positive integer or null')
+        return params
+
+    def write_response(self, writer: asyncio.StreamWriter, status: int, payload: Any, keep_alive: bool) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        head = (f'HTTP/1.1 {status} {STATUS.get(status, "")}\r\n'
+                'Content-Type: application/json; charset=utf-8\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n')
+        writer.write(head.encode('latin-1') + body)
+
+
+def is_loopback(host: str) -> bool:
+    """Все ли адреса, в которые разрешается `host`, - локальные (127.0.0.0/8, ::1)
+    """
+    try:
+        infos = socket.getaddrinfo(host, None)
+    except socket.gaierror:
+        return False
+    return bool(infos) and all(ipaddress.ip_address(info[4][0].split('%')[0]).is_loopback for info in infos)
+
+
+def serve(host: str = '127.0.0.1', port: int = 8765, methods: Optional[List[str]] = None,
+          max_batch_size: int = 32, max_latency: float = 0.01, threads: int = 1,
+          options: Optional[Dict[str, Dict[str, Any]]] = None, ready: Optional[Callable[[], None]] = None) -> None:
+    """Запускает сервис и работает до прерывания
+
+    Args:
+        host (str): Локальный адрес (`127.0.0.1`, `::1`, `localhost`); другие отклоняются.
+
+        port (int): Порт.
+
+        methods (Optional[List[str]]): Какие генераторы обслуживать. По умолчанию - все.
+
+        max_batch_size (int): Максимальное количество текстов в пачке.
+
+        max_latency (float): Бюджет задержки на сбор пачки, секунды.
+
+        threads (int): Количество потоков для моделей.
+
+        options (Optional[Dict[str, Dict[str, Any]]]): Параметры конструкторов генераторов по их именам.
+
+        ready (Optional[Callable[[], None]]): Вызывается, когда сервис готов принимать запросы.
+    """
+    if not is_loopback(host):
+        # У сервиса нет аутентификации: наружу его открывать нельзя
+        raise ValueError(f'{host} is not a loopback address: the service only listens locally')
+    server = Server(methods, max_batch_size=max_batch_size, max_latency=max_latency, threads=threads,
+                    options=options)
+    server.load()
+
+    async def main():
+        listener = await server.start(host, port)
+        if ready is not None:
+            ready()
+        try:
+            async with listener:
+                await listener.serve_forever()
+        finally:
+            await server.stop()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
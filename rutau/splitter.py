@@ -1,9 +1,64 @@
 """Разбиваем текст нужным образом
 """
-from typing import List
+from typing import Iterator, List, Optional, Tuple
 from razdel import sentenize
 
 
+def get_sents(text: str) -> List[str]:
+    """Разбиваем текст на предложения
+
+    Args:
+        text (str): Входной текст
+
+    Returns:
+        List[str]: Список предложений
+    """
+    return [sent.text for sent in sentenize(text)]
+
+def iter_sent_pairs(sents: List[str], max_distance: Optional[int] = None) -> Iterator[Tuple[int, int, str, int]]:
+    """Лениво перебираем пары предложений: каждое со всеми последующими в пределах окна
+
+    Пары различаются по номерам предложений, поэтому повторяющиеся предложения не теряются.
+
+    Args:
+        sents (List[str]): Предложения текста
+
+        max_distance (Optional[int]): Максимальное расстояние между предложениями пары.
+        1 - только последовательные предложения, None - без ограничения.
+
+    Yields:
+        Tuple[int, int, str, int]: Номер первого предложения, номер второго, текст пары
+        и смещение второго предложения в тексте пары
+    """
+    for i, sentA in enumerate(sents):
+        last = len(sents) if max_distance is None else min(len(sents), i + 1 + max_distance)
+        for j in range(i + 1, last):
+            yield i, j, sentA + ' ' + sents[j], len(sentA) + 1
+
+def iter_stead_sent_pairs(text: str) -> Iterator[Tuple[int, int, str, int]]:
+    """Генератор пар последовательных предложений (первое и второе)
+
+    Args:
+        text (str): Входной текст
+
+    Yields:
+        Tuple[int, int, str, int]: Номера предложений, текст пары, смещение второго предложения
+    """
+    return iter_sent_pairs(get_sents(text), max_distance=1)
+
+def iter_diff_sent_pairs(text: str, max_distance: Optional[int] = None) -> Iterator[Tuple[int, int, str, int]]:
+    """Генератор пар предложений: соединяем все со всеми последующими
+
+    Args:
+        text (str): Входной текст
+
+        max_distance (Optional[int]): Максимальное расстояние между предложениями пары
+
+    Yields:
+        Tuple[int, int, str, int]: Номера предложений, текст пары, смещение второго предложения
+    """
+    return iter_sent_pairs(get_sents(text), max_distance=max_distance)
+
 def get_stead_sent_pairs(text: str) -> List[str]:
     """Разбиваем текст на пары последовательных предложений (первое и второе)
 
@@ -13,26 +68,17 @@ def get_stead_sent_pairs(text: str) -> List[str]:
     Returns:
         List[str]: Список пар предложений
     """
-    sents = [sent.text for sent in sentenize(text)]
-    sent_pairs = []
-    for i in range(0, len(sents)):
-        if i+1 < len(sents):
-            sent_pairs.append(sents[i] + ' ' + sents[i+1])
-    return sent_pairs
-
-def get_diff_sent_pairs(text: str) -> List[str]:
+    return [pair for _, _, pair, _ in iter_stead_sent_pairs(text)]
+
+def get_diff_sent_pairs(text: str, max_distance: Optional[int] = None) -> List[str]:
     """Разбиваем текст на пары предложений: соединяем все со всеми последующими
 
     Args:
         text (str): Входной текст
 
+        max_distance (Optional[int]): Максимальное расстояние между предложениями пары
+
     Returns:
         List[str]: Список пар предложений
     """
-    sents = [sent.text for sent in sentenize(text)]
-    sent_pairs = []
-    for posA, sentA in enumerate(sents):
-        for posB, sentB in enumerate(sents):
-            if (sentA != sentB) and (posA < posB):
-                sent_pairs.append(sentA + ' ' + sentB)
-    return sent_pairs
\ No newline at end of file
+    return [pair for _, _, pair, _ in iter_diff_sent_pairs(text, max_distance)]
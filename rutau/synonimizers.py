@@ -1,22 +1,82 @@
 import os
-from typing import List
-import pymorphy2
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Union
+import numpy as np
 from razdel import tokenize
-import pickle
 import random
-from . import models_path, data_path, load_w2v, load_ner
+from . import data_path, get_model, load_nomen
+from .document import Document, as_document
+from .instrument import stage
+from .neighbours import most_similar_rows
+from .template import TextTemplate
+
+def nomen_path(type: str) -> str:
+    """Путь к словарю имён (`name`) или фамилий (`surname`)
+
+    С пакетом поставляется только словарь имён: словарь фамилий `surnames.pickle`
+    (`фамилия -> род`) нужно положить в `rutau/datafiles` самостоятельно.
+    """
+    return os.path.join(data_path, 'surnames.pickle' if type == 'surname' else 'names.pickle')
+
+@lru_cache(maxsize=None)
+def nomen_pools(path: str) -> Dict[str, List[str]]:
+    """Словарь имён или фамилий по роду, загружается один раз на процесс (см. `rutau.load_nomen`)
+    """
+    return load_nomen(path)
 
 class Synonimizer:
     """Набор методов для синонимизации текста
     """
-    def __init__(self):
-        with open(os.path.join(data_path, 'surnames.pickle'), 'rb') as fp:
-            self.surnames = pickle.load(fp)
-        with open(os.path.join(data_path, 'names.pickle'), 'rb') as fp:
-            self.names = pickle.load(fp)
-    
-        self.ner = load_ner(models_path)
-        self.morph = pymorphy2.MorphAnalyzer()
+    def __init__(self, use_neighbours: bool = False, seed: Optional[int] = None, vectors: str = 'float32'):
+        """
+        Args:
+            use_neighbours (bool): Искать "синонимы" в заранее посчитанной таблице соседей
+            (см. `rutau.neighbours`) вместо полной модели word2vec.
+
+            seed (Optional[int]): Зерно генератора случайных чисел экземпляра.
+
+            vectors (str): Точность векторов word2vec: `float32`, `float16` или `int8`
+            (сжатые модели - см. `rutau.compact`).
+        """
+        if vectors not in ['float32', 'float16', 'int8']:
+            raise ValueError(f'Unknown vectors precision: {vectors}')
+        self.use_neighbours = use_neighbours
+        self.vectors = vectors
+        self.random = random.Random(seed)
+        self.morph = get_model('morph')
+
+    @property
+    def ner(self):
+        """NER-модель из общего реестра, загружается при первом обращении"""
+        return get_model('ner')
+
+    @property
+    def w2v_model(self):
+        """Модель word2vec из общего реестра, загружается при первом обращении"""
+        return get_model('w2v' if self.vectors == 'float32' else f'w2v_{self.vectors}')
+
+    @property
+    def neighbours(self):
+        """Таблица соседей из общего реестра, загружается при первом обращении"""
+        return get_model('neighbours')
+
+    def nomen_pool(self, gender: str, type: str) -> List[str]:
+        """Все имена или фамилии заданного рода
+
+        Списки загружаются один раз на процесс и общие для всех экземпляров.
+
+        Args:
+            gender (str): Род имён: `f`, `m`.
+
+            type (str): `name` или `surname`.
+
+        Returns:
+            List[str]: Список имён.
+        """
+        path = nomen_path(type)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f'{path} not found: the {type} list is not shipped with rutau')
+        return nomen_pools(path).get(gender, [])
 
     def get_nomen(self, count: int, gender: str, type: str) -> List[str]:
         """Генерация случайных имён и фамилий
@@ -35,13 +95,7 @@ class Synonimizer:
         Returns:
             List[str]: Список сгенерированных имён.
         """
-        lst = list(self.surnames.items()) if type == 'surname' else list(self.names.items())
-        selected_items = []
-        while len(selected_items) < count:
-            item = random.choice(lst)
-            if item[1] == gender and item[0] not in selected_items:
-                selected_items.append(item[0])
-        return selected_items
+        return self.random.sample(self.nomen_pool(gender, type), count)
 
     def select_by_pos(self, word_list: List[str], pos: str) -> List[str]:
         """Вспомогательный метод: выбирает из списка слов только слова 
@@ -74,10 +128,9 @@ class Synonimizer:
         Returns:
             str: Преобразованное в нужную форму слово.
         """
-        tag = self.morph.parse(word_from)[0].tag
-        word_to = self.morph.parse(word_to)[0]
-        tagset = set()
-        try:
+        with stage('morph'):
+            tag = self.morph.parse(word_from)[0].tag
+            tagset = set()
             if tag.gender is not None:
                 tagset.add(tag.gender)
             if tag.person is not None:
@@ -88,9 +141,9 @@ class Synonimizer:
                 tagset.add(tag.number)
             if 'Af-p' in tag:
                 tagset.add('Af-p')
-            result = word_to.inflect(tagset).word
-        except:
-            result = word_to.word
+            result = self.morph.inflect(word_to, frozenset(tagset))
+            if result is None:
+                result = self.morph.parse(word_to)[0].word
         return result
 
     def get_similars(self, word: str, type: str) -> List[str]:
@@ -104,88 +157,185 @@ class Synonimizer:
         Returns:
             List[str]: Список похожих слов.
         """
-        self.w2v_model = load_w2v(models_path)
-        normal_form = self.morph.parse(word)[0].normal_form
-        try:
-            similars = self.w2v_model.most_similar(normal_form + f'_{type}')
-            sim_list = [item[0].split(f'_{type}')[0] for item in similars if type in item[0]]
-        except:
-            sim_list = []
-        return sim_list
-
-    def synonimize_text(self, text: str, type: List[str]) -> List[str]:
+        return self.get_similars_batch([word], type)[0]
+
+    def get_similars_batch(self, words: List[str], pos: str, topn: int = 10,
+                           batch_size: int = 64, lemmas: Optional[List[str]] = None) -> List[List[str]]:
+        """Пакетный поиск похожих слов по word2vec
+
+        Векторы всех слов собираются в одну матрицу, и близость ко всему словарю
+        считается одним матричным умножением на пакет из `batch_size` слов.
+        Если включён `use_neighbours`, соседи читаются из таблицы соседей, и векторы не нужны.
+
+        Args:
+            words (List[str]): Слова-шаблоны, для которых осуществляется поиск "синонимов".
+
+            pos (str): Часть речи слов. Например, 'NOUN', 'ADJF' или 'VERB'.
+
+            topn (int): Сколько ближайших соседей рассматривать для каждого слова.
+
+            batch_size (int): Сколько слов обрабатывать одним матричным умножением.
+
+            lemmas (Optional[List[str]]): Нормальные формы слов, если уже известны (например, из `Document`).
+
+        Returns:
+            List[List[str]]: Списки похожих слов в порядке входных слов.
+        """
+        if lemmas is None:
+            with stage('morph', len(words)):
+                lemmas = [self.morph.parse(word)[0].normal_form for word in words]
+        keys = [lemma + f'_{pos}' for lemma in lemmas]
+        with stage('w2v', len(words)):
+            return self._similars_by_keys(keys, pos, topn, batch_size)
+
+    def _similars_by_keys(self, keys: List[str], pos: str, topn: int, batch_size: int) -> List[List[str]]:
+        if self.use_neighbours:
+            table = self.neighbours
+            similars = {}
+            for key in set(keys):
+                if key in table.vocab:
+                    similars[key] = [
+                        neighbour.split(f'_{pos}')[0]
+                        for neighbour, _ in table.most_similar(key, topn) if pos in neighbour]
+            return [similars.get(key, []) for key in keys]
+
+        w2v_model = self.w2v_model
+        # Каждое слово словаря считаем один раз, даже если оно встретилось несколько раз
+        rows = {}
+        for key in keys:
+            if key in w2v_model.vocab and key not in rows:
+                rows[key] = w2v_model.vocab[key].index
+        similars = {}
+        unique_keys = list(rows)
+        for i in range(0, len(unique_keys), batch_size):
+            chunk = unique_keys[i:i+batch_size]
+            indexes = np.array([rows[key] for key in chunk])
+            neighbour_ids, _ = most_similar_rows(w2v_model.vectors_norm, indexes, topn)
+            for key, neighbours in zip(chunk, neighbour_ids.tolist()):
+                similars[key] = [
+                    w2v_model.index2word[n].split(f'_{pos}')[0]
+                    for n in neighbours if pos in w2v_model.index2word[n]]
+        return [similars.get(key, []) for key in keys]
+
+    def document_candidates(self, doc: Document, type: List[str]) -> List[Tuple[str, str, str]]:
+        """Вспомогательный метод: выбирает из токенов документа слова-кандидаты на замену
+
+        Args:
+            doc (Document): Размеченный документ (см. `rutau.document`).
+
+            type (List[str]): Части речи слов, которые подвергнутся замене.
+
+        Returns:
+            List[Tuple[str, str, str]]: Тройки (слово, часть речи, лемма) в порядке NOUN, ADJF, VERB.
+        """
+        candidates = []
+        for pos in ['NOUN', 'ADJF', 'VERB']:
+            if pos not in type:
+                continue
+            for token, parse in zip(doc.tokens, doc.morph):
+                if parse.tag.POS != pos or (pos == 'NOUN' and 'Name' in parse.tag):
+                    continue
+                candidates.append((token.text, pos, parse.normal_form))
+        return candidates
+
+    def synonimize_text(self, text: Union[str, Document], type: List[str]) -> List[str]:
         """Метод синонимизирует текст на основе word2vec.
     
         Метод получает "синонимы" определённых слов и создаёт новые тексты, заменяя слова оригинального
         текста синонимами.
     
         Args:
-            text (str): Оригинальный текст, который нужно аугментировать.
+            text (Union[str, Document]): Оригинальный текст, который нужно аугментировать
+            (или размеченный документ, см. `rutau.document`).
     
             type (List[str]): Часть речи слов, которые подвергнутся замене. Список: ['NOUN', 'ADJF', 'VERB'].
     
         Returns:
             List[str]: Список аугментированных текстов.
         """
-        selected_words: List[str] = []
-        if len(text) < 1:
-            # Слишком короткий текст
-            return []
-        
-        tokens = list(tokenize(text))
-        tokens = [_.text for _ in tokens]
-    
-        new_list: List[str] = []
-        counter: int = 0
-        mean_len: int = 0
-    
-        # Выбираем все слова для заданной части речи
-        if 'NOUN' in type:
-            selected_words = self.select_by_pos(word_list=tokens, pos='NOUN')
-            for word in selected_words:
-                if 'Name' not in self.morph.parse(word)[0].tag:
-                    sim_list = self.get_similars(word=word, type='NOUN')
-                    if len(sim_list) > 0:
-                        sim_list = [self.transform_word(word_from=word, word_to=sim) for sim in sim_list]
-                        new_list.append([word, sim_list])
-                        counter += 1
-                        mean_len += len(sim_list)
-        if 'ADJF' in type:
-            selected_words = self.select_by_pos(word_list=tokens, pos='ADJF')
-            for word in selected_words:
-                sim_list = self.get_similars(word=word, type='ADJF')
-                if len(sim_list) > 0:
-                    sim_list = [self.transform_word(word_from=word, word_to=sim) for sim in sim_list]
-                    new_list.append([word, sim_list])
-                    counter += 1
-                    mean_len += len(sim_list)
-        if 'VERB' in type:
-            selected_words = self.select_by_pos(word_list=tokens, pos='VERB')
-            for word in selected_words:
-                sim_list = self.get_similars(word=word, type='VERB')
+        return self.synonimize_texts([text], type)[0]
+
+    def synonimize_texts(self, texts: List[Union[str, Document]], type: List[str]) -> List[List[str]]:
+        """Синонимизирует пакет текстов.
+
+        То же, что `synonimize_text`, но "синонимы" для всех слов всех текстов ищутся
+        одним пакетным запросом на каждую часть речи. Токены, разборы и леммы
+        берутся из слоёв `Document` и считаются не больше одного раза.
+
+        Args:
+            texts (List[Union[str, Document]]): Оригинальные тексты или размеченные документы.
+
+            type (List[str]): Часть речи слов, которые подвергнутся замене. Список: ['NOUN', 'ADJF', 'VERB'].
+
+        Returns:
+            List[List[str]]: Списки аугментированных текстов в порядке входных текстов.
+        """
+        docs = [as_document(text) for text in texts]
+        candidates = [self.document_candidates(doc, type) for doc in docs]
+
+        # Один пакетный запрос на каждую часть речи; ключи word2vec - из лемм документа
+        similars = {}
+        for pos in ['NOUN', 'ADJF', 'VERB']:
+            lemmas = {word: lemma for items in candidates for word, word_pos, lemma in items if word_pos == pos}
+            sim_lists = self.get_similars_batch(list(lemmas), pos, lemmas=list(lemmas.values()))
+            for word, sim_list in zip(lemmas, sim_lists):
+                similars[(word, pos)] = sim_list
+
+        results = []
+        for doc, items in zip(docs, candidates):
+            new_list: List = []
+            for word, pos, _ in items:
+                sim_list = similars[(word, pos)]
                 if len(sim_list) > 0:
                     sim_list = [self.transform_word(word_from=word, word_to=sim) for sim in sim_list]
                     new_list.append([word, sim_list])
-                    counter += 1
-                    mean_len += len(sim_list)
-        
-        if mean_len == 0:
+            with stage('assemble'):
+                results.append(self.generate_texts(doc.text, new_list, doc.tokens))
+        return results
+
+    def generate_texts(self, text: str, new_list: List, tokens: Optional[List] = None) -> List[str]:
+        """Вспомогательный метод: генерирует новые тексты из найденных замен
+
+        Текст один раз разбивается на шаблон (см. `rutau.template`), в котором слотами
+        становятся токены заменяемых слов, и каждый вариант собирается одним `join`.
+        Заменяются только целые токены, а не подстроки других слов.
+
+        Args:
+            text (str): Оригинальный текст.
+
+            new_list (List): Список пар [слово, список замен].
+
+            tokens (Optional[List]): Токены razdel этого текста, если уже посчитаны.
+
+        Returns:
+            List[str]: Список аугментированных текстов.
+        """
+        if len(new_list) == 0:
             # Синонимов не найдено
             return []
-        mean_len = int(mean_len / counter)
-        
-        # Генерируем новые тексты
-        new_texts = [text] * mean_len
-        for item in new_list:
+        mean_len = int(sum(len(item[1]) for item in new_list) / len(new_list))
+
+        # Для каждого слова выбираем замену в каждом варианте
+        replacements: Dict[str, List[str]] = {}
+        for word_from, sim_list in new_list:
+            if word_from in replacements:
+                continue
+            variants = []
             for num in range(0, mean_len):
-                word_from = item[0]
-                if len(item[1]) >= mean_len:
-                    word_to = item[1][num]
+                if len(sim_list) >= mean_len:
+                    word_to = sim_list[num]
                 else:
-                    word_to = random.choice(item[1])
+                    word_to = self.random.choice(sim_list)
                 if word_from.istitle():
                     word_to = word_to.capitalize()
                 if word_from.isupper():
                     word_to = word_to.upper()
-                new_texts[num] = new_texts[num].replace(word_from, word_to)
-        return new_texts
+                variants.append(word_to)
+            replacements[word_from] = variants
+
+        # Генерируем новые тексты
+        if tokens is None:
+            tokens = list(tokenize(text))
+        slots = [token for token in tokens if token.text in replacements]
+        template = TextTemplate.from_spans(text, [(token.start, token.stop) for token in slots])
+        return [template.render([replacements[token.text][num] for token in slots]) for num in range(0, mean_len)]
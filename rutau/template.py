@@ -0,0 +1,73 @@
+"""Шаблон текста для быстрой сборки вариантов
+
+Текст один раз разбивается на неизменные куски и слоты. Каждый вариант собирается
+одним `join`, а позиции слотов в новом тексте считаются по длинам подставленных значений.
+"""
+from typing import List, Sequence, Tuple
+
+
+class TextTemplate:
+    """Текст, разбитый на неизменные куски и слоты для подстановки
+
+    `segments[0] + slots[0] + segments[1] + ... + slots[-1] + segments[-1]` - исходный текст.
+    """
+    def __init__(self, segments: List[str], slots: List[str]):
+        if len(segments) != len(slots) + 1:
+            raise ValueError('A template needs exactly one more segment than slots')
+        self.segments = segments
+        self.slots = slots
+
+    @classmethod
+    def from_spans(cls, text: str, spans: Sequence[Tuple[int, int]]) -> 'TextTemplate':
+        """Строит шаблон из текста и позиций слотов
+
+        Args:
+            text (str): Исходный текст.
+
+            spans (Sequence[Tuple[int, int]]): Начало и конец каждого слота, по возрастанию, без пересечений.
+
+        Returns:
+            TextTemplate: Шаблон
+        """
+        segments, slots = [], []
+        position = 0
+        for start, stop in spans:
+            if start < position:
+                raise ValueError(f'Overlapping or unsorted slot: {start}-{stop}')
+            segments.append(text[position:start])
+            slots.append(text[start:stop])
+            position = stop
+        segments.append(text[position:])
+        return cls(segments, slots)
+
+    def render(self, values: Sequence[str]) -> str:
+        """Собирает текст, подставляя значения в слоты
+
+        Args:
+            values (Sequence[str]): Значение для каждого слота.
+
+        Returns:
+            str: Новый текст
+        """
+        parts = [self.segments[0]]
+        for value, segment in zip(values, self.segments[1:]):
+            parts.append(value)
+            parts.append(segment)
+        return ''.join(parts)
+
+    def offsets(self, values: Sequence[str]) -> List[Tuple[int, int]]:
+        """Позиции слотов в тексте, собранном `render(values)`
+
+        Args:
+            values (Sequence[str]): Значение для каждого слота.
+
+        Returns:
+            List[Tuple[int, int]]: Начало и конец каждого слота
+        """
+        spans = []
+        position = 0
+        for segment, value in zip(self.segments, values):
+            position += len(segment)
+            spans.append((position, position + len(value)))
+            position += len(value)
+        return spans
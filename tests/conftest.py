@@ -0,0 +1,19 @@
+"""Общие фикстуры тестов: модели из реестра подменяются заменителями из `benchmarks.stubs`
+"""
+import pytest
+
+
+@pytest.fixture(scope='session')
+def texts():
+    from benchmarks.run import load_corpus
+    return load_corpus()
+
+
+@pytest.fixture(scope='session')
+def stub_models(texts):
+    """NER, word2vec и теггеры natasha - заменители, pymorphy2 и сегментатор natasha - настоящие
+    """
+    pytest.importorskip('natasha')
+    from benchmarks import stubs
+    stubs.install(texts, vocab_size=2000)
+    return texts
@@ -0,0 +1,65 @@
+import pytest
+import rutau
+from rutau.annotation_cache import AnnotationCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    with AnnotationCache(str(tmp_path / 'annotations.sqlite'), version='test') as cache:
+        yield cache
+
+
+def test_get_put(cache):
+    cache.put_many('anaphorate.ner', {'Мама мыла раму.': [[0, 4, 'PER']]})
+    assert cache.get('anaphorate.ner', 'Мама мыла раму.') == [[0, 4, 'PER']]
+    assert cache.get('coref.ner', 'Мама мыла раму.') is None
+    assert cache.get_many('anaphorate.ner', ['Мама мыла раму.', 'Папа.']) == {'Мама мыла раму.': [[0, 4, 'PER']]}
+    assert cache.cache_info()['annotations']['hits'] == 2
+
+
+def test_evict_least_recently_used(cache):
+    for i in range(10):
+        cache.put('kind', f'text {i}', 'x' * 98)
+    # Обращение обновляет время доступа: `text 0` не вытесняется первым
+    assert cache.get('kind', 'text 0') is not None
+    total = cache.size()
+    assert cache.evict(total) == 0
+    removed = cache.evict(500)
+    assert cache.size() <= 450
+    assert removed == 10 - cache.cache_info()['annotations']['size']
+    assert cache.get('kind', 'text 0') is not None
+    assert cache.get('kind', 'text 1') is None
+
+
+def test_max_bytes(tmp_path):
+    with AnnotationCache(str(tmp_path / 'annotations.sqlite'), max_bytes=1000, version='test') as cache:
+        for batch in range(50):
+            cache.put_many('kind', {f'text {batch} {i}': 'x' * 98 for i in range(3)})
+            assert cache.size() <= 1000
+        # Последняя пачка не вытеснена
+        assert len(cache.get_many('kind', [f'text 49 {i}' for i in range(3)])) == 3
+        cache.clear()
+        assert cache.size() == 0
+
+
+def load_first(path):
+    return 'first'
+
+
+def load_second(path):
+    return 'second'
+
+
+def test_key_depends_on_models(tmp_path):
+    original = rutau._loaders['ner']
+    try:
+        with AnnotationCache(str(tmp_path / 'annotations.sqlite')) as cache:
+            rutau.register_model('ner', load_first)
+            before = cache.kind_version('anaphorate.ner')
+            cache.put('anaphorate.ner', 'Текст.', [])
+            assert cache.get('anaphorate.ner', 'Текст.') == []
+            rutau.register_model('ner', load_second)
+            assert cache.kind_version('anaphorate.ner') != before
+            assert cache.get('anaphorate.ner', 'Текст.') is None
+    finally:
+        rutau.register_model('ner', original)
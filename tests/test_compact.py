@@ -0,0 +1,40 @@
+import os
+import numpy as np
+import pytest
+from rutau.compact import CompactKeyedVectors, CompactMatrix
+
+
+def make_model(dtype, size=50, seed=0):
+    vectors = np.random.RandomState(seed).standard_normal((size, 16)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    keys = [f'слово{i}_NOUN' for i in range(size)]
+    return CompactKeyedVectors(keys, CompactMatrix.from_float(vectors, dtype), {'dtype': dtype}), vectors
+
+
+@pytest.mark.parametrize('dtype', ['float16', 'int8'])
+def test_save_load(tmp_path, dtype):
+    model, vectors = make_model(dtype)
+    path = str(tmp_path / 'model')
+    model.save(path)
+    loaded = CompactKeyedVectors.load(path)
+    assert loaded.index2word == model.index2word
+    assert np.abs(loaded.vectors.rows(np.arange(len(vectors))) - vectors).max() < 0.02
+    assert loaded.most_similar('слово0_NOUN', topn=1)[0][0] == model.most_similar('слово0_NOUN', topn=1)[0][0]
+
+
+def test_save_replaces_model_atomically(tmp_path):
+    path = str(tmp_path / 'model')
+    make_model('int8', size=50)[0].save(path)
+    make_model('float16', size=30, seed=1)[0].save(path)
+    # От старой модели не остаётся файлов, временные папки удалены
+    assert sorted(os.listdir(path)) == ['meta.json', 'vectors.npy', 'vocab.txt']
+    assert os.listdir(str(tmp_path)) == ['model']
+    assert len(CompactKeyedVectors.load(path).index2word) == 30
+
+
+def test_load_int8_without_scales(tmp_path):
+    path = str(tmp_path / 'model')
+    make_model('int8')[0].save(path)
+    os.remove(os.path.join(path, 'scales.npy'))
+    with pytest.raises(ValueError, match='scales.npy'):
+        CompactKeyedVectors.load(path)
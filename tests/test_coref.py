@@ -0,0 +1,198 @@
+import random
+from types import SimpleNamespace
+import pytest
+from razdel import tokenize
+from rutau.coref import CorefItem
+
+
+@pytest.fixture(scope='module')
+def coref(stub_models):
+    from rutau import Coref
+    return Coref()
+
+
+def links(coref_sequence):
+    """Связи `doc_corefs` в виде `(лемма, начало, конец, антецедент)`"""
+    return sorted((item.lemma, item.start, item.stop, item.coref) for item in coref_sequence if item.coref != -100)
+
+
+def original_doc_corefs(doc):
+    """Построение цепочек до перехода на индекс лемм: эталон для `Coref.doc_corefs`"""
+    extracted_lemmas = {}
+    for span in doc.spans:
+        for token in span.tokens:
+            if token.lemma in extracted_lemmas:
+                extracted_lemmas[token.lemma] += 1
+            else:
+                extracted_lemmas[token.lemma] = 1
+    selected_items = [item for item in extracted_lemmas if extracted_lemmas[item] > 1]
+
+    coref_sequence = []
+    for item in selected_items:
+        antecedent_found = -100
+        for span in doc.spans:
+            for token in span.tokens:
+                if token.lemma == item:
+                    if antecedent_found == -100:
+                        antecedent_found = span.start
+                        coref_sequence.append(CorefItem(span.text, token.lemma, span.type, span.start, span.stop))
+                    else:
+                        coref_sequence.append(CorefItem(
+                            span.text, token.lemma, span.type, span.start, span.stop, antecedent_found))
+
+    sequence = [token for token in doc.tokens]
+    indexes = {}
+    for item in coref_sequence:
+        for i, token in enumerate(doc.tokens):
+            if item.start == token.start:
+                indexes[item.start] = i
+                item.start = i
+            if item.stop == token.stop:
+                item.stop = i
+
+    for item in coref_sequence:
+        if item.coref != -100:
+            item.coref = indexes[item.coref]
+    return sequence, coref_sequence
+
+
+def original_coref_to_dict(coref_sequence):
+    """`Coref.coref_to_dict` до группировки упоминаний по антецеденту"""
+    ants = []
+    ments = []
+    for itm in coref_sequence:
+        if itm.coref == -100:
+            ants.append({'token': itm.token, 'lemma': itm.lemma, 'start': itm.start, 'end': itm.stop})
+        else:
+            ments.append({'token': itm.token, 'lemma': itm.lemma, 'start': itm.start, 'end': itm.stop,
+                          'coref': itm.coref})
+    return [{'antecedent': a, 'mentions': [m for m in ments if m['coref'] == a['start']]} for a in ants]
+
+
+def random_doc(rng):
+    """Документ с токенами и NER-сущностями из 1-3 токенов с повторяющимися леммами"""
+    tokens = []
+    position = 0
+    for _ in range(rng.randint(1, 40)):
+        length = rng.randint(1, 5)
+        tokens.append(SimpleNamespace(start=position, stop=position + length, text='т' * length,
+                                      lemma=rng.choice('абвгде')))
+        position += length + 1
+    spans = []
+    i = 0
+    while i < len(tokens):
+        if rng.random() < 0.4:
+            span_tokens = tokens[i:i + rng.randint(1, 3)]
+            spans.append(SimpleNamespace(start=span_tokens[0].start, stop=span_tokens[-1].stop, text=f'сущность{i}',
+                                         type=rng.choice(['PER', 'LOC', 'ORG']), tokens=span_tokens))
+            i += len(span_tokens)
+        else:
+            i += 1
+    return SimpleNamespace(tokens=tokens, spans=spans)
+
+
+def assert_same_chains(coref, doc):
+    sequence, corefs = coref.doc_corefs(doc)
+    original_sequence, original_corefs = original_doc_corefs(doc)
+    assert sequence == original_sequence
+    assert corefs == original_corefs
+    assert coref.coref_to_dict(corefs) == original_coref_to_dict(original_corefs)
+
+
+def test_doc_corefs_matches_original(coref):
+    rng = random.Random(0)
+    for _ in range(300):
+        assert_same_chains(coref, random_doc(rng))
+
+
+def test_doc_corefs_matches_original_on_corpus(coref, stub_models):
+    for text in stub_models + [' '.join(stub_models)]:
+        assert_same_chains(coref, coref.annotate(text))
+
+
+def make_sequence(words, feats):
+    return [SimpleNamespace(text=word, feats=feats.get(i)) for i, word in enumerate(words)]
+
+
+def make_corefs():
+    # Упоминание из двух токенов попадает в цепочки обеих лемм
+    return [
+        CorefItem('Мария Бутина', 'мария', 'PER', 0, 1),
+        CorefItem('Мария Бутина', 'мария', 'PER', 5, 6, 0),
+        CorefItem('Мария Бутина', 'бутина', 'PER', 0, 1),
+        CorefItem('Мария Бутина', 'бутина', 'PER', 5, 6, 0),
+        CorefItem('США', 'сша', 'LOC', 3, 3),
+        CorefItem('США', 'сша', 'LOC', 9, 9, 3),
+    ]
+
+
+WORDS = ['Мария', 'Бутина', 'прилетела', 'США', '.', 'Мария', 'Бутина', 'любит', 'в', 'США', '.']
+FEATS = {5: {'Gender': 'Fem', 'Case': 'Nom'}, 9: {'Number': 'Plur', 'Case': 'Acc'}}
+
+
+def test_replace_multi_token_mentions(coref):
+    sequence, corefs = coref.replace_with_pronouns(make_sequence(WORDS, FEATS), make_corefs(), shift=False)
+    assert sequence == ['Мария', 'Бутина', 'прилетела', 'США', '.', 'она', 'любит', 'в', 'их', '.']
+    assert [(item.token, item.start, item.stop, item.coref) for item in corefs] == [
+        ('Мария Бутина', 0, 1, -100),
+        ('она', 5, 5, 0),
+        ('Мария Бутина', 0, 1, -100),
+        ('она', 5, 5, 0),
+        ('США', 3, 3, -100),
+        ('их', 8, 8, 3),
+    ]
+
+
+def test_replace_multi_token_mentions_with_shift(coref):
+    sequence, corefs = coref.replace_with_pronouns(make_sequence(WORDS, FEATS), make_corefs(), shift=True)
+    # Местоимение встаёт перед предыдущим токеном
+    assert sequence == ['Мария', 'Бутина', 'прилетела', 'США', 'она', '.', 'любит', 'их', 'в', '.']
+    assert [(item.start, item.stop, item.coref) for item in corefs] == [
+        (0, 1, -100), (4, 4, 0), (0, 1, -100), (4, 4, 0), (3, 3, -100), (7, 7, 3),
+    ]
+    for item in corefs:
+        assert ' '.join(sequence[item.start:item.stop + 1]) == item.token
+
+
+def test_replace_skips_overlapping_mentions(coref):
+    sequence = make_sequence(['Мария', 'Бутина', '.', 'Мария', 'Бутина', '.'], {3: {'Gender': 'Fem'}})
+    corefs = [
+        CorefItem('Мария Бутина', 'мария', 'PER', 0, 1),
+        CorefItem('Мария Бутина', 'мария', 'PER', 3, 4, 0),
+        CorefItem('Бутина', 'бутина', 'PER', 0, 0),
+        CorefItem('Бутина', 'бутина', 'PER', 4, 4, 0),
+    ]
+    new_sequence, corefs = coref.replace_with_pronouns(sequence, corefs, shift=False)
+    assert new_sequence == ['Мария', 'Бутина', '.', 'она', '.']
+    assert (corefs[1].token, corefs[1].start, corefs[1].stop) == ('она', 3, 3)
+    # Вложенное упоминание не заменяется отдельно, а указывает на местоимение
+    assert (corefs[3].token, corefs[3].start, corefs[3].stop) == ('Бутина', 3, 3)
+
+
+@pytest.mark.parametrize('window, overlap', [(1000, 0), (4, 1), (3, 0), (2, 1)])
+def test_stream_corefs_offsets(coref, stub_models, window, overlap):
+    text = ' '.join(stub_models)
+    tokens = list(tokenize(text))
+    streamed = list(coref.stream_corefs(text, window=window, overlap=overlap))
+    assert streamed
+    for link in streamed:
+        for item in [link['antecedent'], link['mention']]:
+            assert text[tokens[item['start']].start:tokens[item['end']].stop] == item['token']
+        assert link['mention']['coref'] == link['antecedent']['start']
+    # Заменитель NER размечает каждое предложение независимо, поэтому окна не меняют связей
+    _, corefs = coref.select_corefs(text)
+    assert sorted((link['mention']['lemma'], link['mention']['start'], link['mention']['end'],
+                   link['mention']['coref']) for link in streamed) == links(corefs)
+
+
+def test_stream_corefs_paragraphs(coref, stub_models):
+    text = ' '.join(stub_models)
+    assert list(coref.stream_corefs(iter(stub_models), window=4, overlap=1)) == \
+        list(coref.stream_corefs(text, window=4, overlap=1))
+
+
+def test_stream_corefs_evicts_antecedents(coref, stub_models):
+    text = ' '.join(stub_models)
+    assert len(list(coref.stream_corefs(text, max_antecedents=1))) < len(list(coref.stream_corefs(text)))
+    with pytest.raises(ValueError):
+        list(coref.stream_corefs(text, window=2, overlap=2))
@@ -0,0 +1,92 @@
+import json
+import os
+import pytest
+from rutau import corpus
+
+SETTINGS = {'sent_splitting': 'steadily', 'anaph_type': ['PER', 'LOC', 'ORG']}
+
+
+def interrupted(records, count):
+    yield from records[:count]
+    raise RuntimeError('interrupted')
+
+
+def read_shard(path):
+    with corpus.open_text(path) as fp:
+        return [json.loads(line) for line in fp if line.strip()]
+
+
+@pytest.fixture
+def records(stub_models):
+    return [{'text': text} for text in stub_models]
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Сколько раз шарды генерировались заново"""
+    calls = []
+    iter_samples = corpus.iter_samples
+
+    def counting(chunk, *args, **kwargs):
+        calls.append(len(chunk))
+        return iter_samples(chunk, *args, **kwargs)
+
+    monkeypatch.setattr(corpus, 'iter_samples', counting)
+    return calls
+
+
+def test_resume(tmp_path, records, calls):
+    output = str(tmp_path)
+    with pytest.raises(RuntimeError):
+        corpus.run_sharded(interrupted(records, 7), output, 'anaphorate', shard_size=3, **SETTINGS)
+    assert sorted(corpus.load_manifest(output)['shards']) == ['shard-00000.jsonl', 'shard-00001.jsonl']
+    assert calls == [3, 3]
+
+    manifest = corpus.run_sharded(records, output, 'anaphorate', shard_size=3, **SETTINGS)
+    # Готовые шарды не генерируются заново
+    shards = (len(records) + 2) // 3
+    assert calls == [3, 3] + [3] * (shards - 3) + [len(records) - 3 * (shards - 1)]
+    assert len(manifest['shards']) == shards
+    assert sum(shard['documents'] for shard in manifest['shards'].values()) == len(records)
+    for name, shard in manifest['shards'].items():
+        assert shard['samples'] == len(read_shard(os.path.join(output, name)))
+    assert not [name for name in os.listdir(output) if name.endswith('.tmp')]
+
+    # Повторный запуск ничего не генерирует; число процессов и размер пачки на сэмплы не влияют
+    assert corpus.run_sharded(records, output, 'anaphorate', shard_size=3, batch_size=8, **SETTINGS) == manifest
+    assert len(calls) == shards
+
+
+@pytest.mark.parametrize('changes', [
+    {'anaph_type': ['PER']},
+    {'sent_splitting': 'differently'},
+    {'compress': True},
+    {'shard_size': 4},
+])
+def test_resume_refuses_other_settings(tmp_path, records, changes):
+    output = str(tmp_path)
+    corpus.run_sharded(records[:3], output, 'anaphorate', shard_size=3, **SETTINGS)
+    kwargs = {'shard_size': 3, **SETTINGS, **changes}
+    with pytest.raises(ValueError, match='other settings'):
+        corpus.run_sharded(records, output, 'anaphorate', **kwargs)
+
+
+def test_resume_refuses_changed_input(tmp_path, records):
+    output = str(tmp_path)
+    corpus.run_sharded(records[:3], output, 'anaphorate', shard_size=3, **SETTINGS)
+    changed = [{'text': records[0]['text'] + ' Конец.'}] + records[1:]
+    with pytest.raises(ValueError, match='corpus has changed'):
+        corpus.run_sharded(changed, output, 'anaphorate', shard_size=3, **SETTINGS)
+
+
+def test_resume_with_dedup(tmp_path, records):
+    from rutau.dedup import Deduplicator
+    output = str(tmp_path)
+    doubled = records[:3] + records[:3]
+    with pytest.raises(RuntimeError):
+        corpus.run_sharded(interrupted(doubled, 4), output, 'anaphorate', shard_size=3, dedup=Deduplicator(),
+                           **SETTINGS)
+    # Сэмплы готового шарда попадают в фильтр: повтор входа не даёт новых сэмплов
+    manifest = corpus.run_sharded(doubled, output, 'anaphorate', shard_size=3, dedup=Deduplicator(), **SETTINGS)
+    assert manifest['shards']['shard-00000.jsonl']['samples'] > 0
+    assert manifest['shards']['shard-00001.jsonl']['samples'] == 0
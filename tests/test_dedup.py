@@ -0,0 +1,69 @@
+from rutau.dedup import BoundedHashSet, Deduplicator, HashSet, MinHash
+
+
+def test_hash_set():
+    keys = HashSet(100)
+    assert not keys.add(42)
+    assert keys.add(42)
+    assert 42 in keys and 43 not in keys
+    # 0 - пустая ячейка таблицы, но как ключ тоже запоминается
+    assert not keys.add(0)
+    assert keys.add(0)
+
+
+def test_bounded_hash_set_evicts_old_generation():
+    keys = BoundedHashSet(4)
+    for key in range(1, 5):
+        assert not keys.add(key)
+    # Первое поколение заполнено и стало предыдущим: ключи ещё помнятся
+    assert keys.previous is not None
+    assert all(key in keys for key in range(1, 5))
+    # Ключ из предыдущего поколения переносится в текущее
+    assert keys.add(1)
+    for key in range(5, 8):
+        assert not keys.add(key)
+    # Второе поколение заполнено: первое вытеснено, кроме перенесённого ключа
+    assert 1 in keys
+    assert all(key not in keys for key in range(2, 5))
+    assert all(key in keys for key in range(5, 8))
+
+
+def test_deduplicator_memory_is_bounded():
+    dedup = Deduplicator(max_items=10)
+    samples = [{'text': f'Текст номер {i}'} for i in range(100)]
+    assert len(list(dedup.filter(samples))) == 100
+    assert dedup.exact.current.table.size <= 32
+    # Недавние сэмплы помнятся, самые старые вытеснены
+    assert dedup.is_duplicate(samples[-1])
+    assert not dedup.is_duplicate(samples[0])
+
+
+def test_exact_duplicates():
+    dedup = Deduplicator()
+    samples = [
+        {'text': 'Мама мыла раму.', 'anaphor': {'start': 0}},
+        {'text': 'мама  мыла раму.', 'anaphor': {'start': 0}},
+        {'text': 'Мама мыла раму.', 'anaphor': {'start': 5}},
+    ]
+    assert list(dedup.filter(samples)) == [samples[0], samples[2]]
+    assert dedup.stats() == {'samples': 3, 'exact_duplicates': 1, 'near_duplicates': 0}
+
+
+def test_near_duplicates():
+    dedup = Deduplicator(near_dup=True, near_dup_items=100)
+    text = 'Глава Татарстана Рустам Минниханов провёл совещание в Казани и обсудил развитие транспорта.'
+    samples = [
+        {'text': text},
+        {'text': text.replace('транспорта', 'транспорта региона')},
+        {'text': 'Сборная России по футболу сыграла вничью в товарищеском матче.'},
+    ]
+    assert list(dedup.filter(samples)) == [samples[0], samples[2]]
+    assert dedup.stats()['near_duplicates'] == 1
+
+
+def test_minhash_signature_is_exact_modulo_2_32():
+    minhash = MinHash(num_perm=16)
+    text = 'проверка переполнения произведения'
+    hashes = [int(value) for value in minhash.shingles(text)]
+    expected = [min((int(a) * value + int(b)) % 2 ** 32 for value in hashes) for a, b in zip(minhash.a, minhash.b)]
+    assert minhash.signature(text).tolist() == expected
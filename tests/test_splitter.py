@@ -0,0 +1,39 @@
+from rutau.splitter import get_diff_sent_pairs, get_stead_sent_pairs, get_sents, iter_sent_pairs
+
+SENTS = ['Мама мыла раму.', 'Она устала.', 'Папа пришёл домой.', 'Он помог ей.', 'Рама блестит.']
+
+
+def baseline_stead_pairs(sents):
+    return [sents[i] + ' ' + sents[i+1] for i in range(len(sents)) if i + 1 < len(sents)]
+
+
+def baseline_diff_pairs(sents):
+    return [sentA + ' ' + sentB for posA, sentA in enumerate(sents) for posB, sentB in enumerate(sents)
+            if sentA != sentB and posA < posB]
+
+
+def test_iter_sent_pairs_matches_baseline():
+    for count in range(len(SENTS) + 1):
+        sents = SENTS[:count]
+        assert [pair for _, _, pair, _ in iter_sent_pairs(sents)] == baseline_diff_pairs(sents)
+        assert [pair for _, _, pair, _ in iter_sent_pairs(sents, max_distance=1)] == baseline_stead_pairs(sents)
+
+
+def test_iter_sent_pairs_indices_and_offsets():
+    for i, j, pair, offset in iter_sent_pairs(SENTS, max_distance=2):
+        assert 0 < j - i <= 2
+        assert pair[:offset - 1] == SENTS[i]
+        assert pair[offset:] == SENTS[j]
+
+
+def test_iter_sent_pairs_keeps_repeated_sentences():
+    sents = ['Да.', 'Да.', 'Нет.']
+    assert [(i, j) for i, j, _, _ in iter_sent_pairs(sents)] == [(0, 1), (0, 2), (1, 2)]
+
+
+def test_text_pairs():
+    text = ' '.join(SENTS)
+    assert get_sents(text) == SENTS
+    assert get_stead_sent_pairs(text) == baseline_stead_pairs(SENTS)
+    assert get_diff_sent_pairs(text) == baseline_diff_pairs(SENTS)
+    assert len(get_diff_sent_pairs(text, max_distance=1)) == len(SENTS) - 1